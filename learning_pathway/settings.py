@@ -42,6 +42,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'lms.query_budget.QueryBudgetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -140,3 +141,55 @@ LOGOUT_REDIRECT_URL = 'home'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'lms.User'
+
+# Progress queue
+# Signal receivers only record dirty (student, course) keys; run
+# `python manage.py process_progress_queue` to drain them. In eager mode the
+# keys are recomputed right after the request's transaction commits instead.
+LMS_PROGRESS_QUEUE_EAGER = DEBUG
+
+# Instructor dashboard
+# Seconds to cache each instructor's per-course statistics; 0 disables caching.
+LMS_INSTRUCTOR_DASHBOARD_TIMEOUT = 30
+
+# Query budgets
+# lms/query_budgets.json caps the queries per request of each listed view and
+# the test suite fails when a view exceeds its budget. This share of live
+# requests is counted and those over budget are logged (logger
+# 'lms.query_budget') and tallied for `python manage.py query_budget_violations`;
+# 0 disables it.
+LMS_QUERY_BUDGET_SAMPLE_RATE = 0.01
+
+# Quiz time limits
+# Seconds after an attempt's deadline that answers are still accepted, to allow
+# for the auto-submit sent by the client timer. Attempts left open past that
+# are finalized on their autosaved answers by
+# `python manage.py expire_quiz_attempts`; run it periodically.
+LMS_QUIZ_DEADLINE_GRACE = 30
+
+# Cache
+# Shared by all worker processes: the badge catalog and other version-stamped
+# caches rely on it for cross-worker invalidation. It holds a few entries per
+# active user (dashboard fragment, course access set, version stamps) and per
+# course and quiz (outline, answer key, analysis, stamps); losing a stamp
+# reissues it and orphans everything cached under it, so it must not be culled
+# under normal load. Set REDIS_URL to use Redis (required on more than one
+# host). The file cache fallback lists its directory on every write once it is
+# large, so it only suits small single-host deployments.
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': BASE_DIR / 'cache',
+            'OPTIONS': {
+                'MAX_ENTRIES': 20000,
+            },
+        }
+    }
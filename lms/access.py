@@ -0,0 +1,43 @@
+"""
+Cached course access checks.
+
+Each user's accessible course ids (enrolled courses for students, taught
+courses for instructors) are cached under a per-user version stamp that the
+Enrollment and Course save/delete receivers bump, so checking access to a
+content page costs no queries once warm.
+"""
+from django.core.cache import cache
+from django.db import transaction
+
+from .caching import bump_versions, get_version
+from .models import Course, Enrollment
+
+ACCESS_TIMEOUT = 60 * 10
+
+def _access_version_name(user_id):
+    return f'course_access:{user_id}'
+
+def invalidate_course_access(user_ids):
+    """Drop the cached course access of the given users once the current transaction commits"""
+    names = {_access_version_name(user_id) for user_id in user_ids}
+    if names:
+        transaction.on_commit(lambda: bump_versions(names))
+
+def accessible_course_ids(user):
+    """Ids of the courses a student is enrolled in or an instructor teaches, cached per user"""
+    key = f'lms:course_access:{user.pk}:{get_version(_access_version_name(user.pk))}'
+    course_ids = cache.get(key)
+    if course_ids is None:
+        if user.role == 'instructor':
+            course_ids = Course.objects.filter(instructor=user).values_list('pk', flat=True)
+        else:
+            course_ids = Enrollment.objects.filter(student=user).values_list('course_id', flat=True)
+        course_ids = frozenset(course_ids)
+        cache.set(key, course_ids, ACCESS_TIMEOUT)
+    return course_ids
+
+def can_access_course(user, course_id):
+    """Whether a user may view a course's content: enrolled students and the course's instructor"""
+    if user.role not in ('student', 'instructor'):
+        return True
+    return course_id in accessible_course_ids(user)
@@ -2,9 +2,17 @@ from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from .models import (
     User, Course, Enrollment, Module, Lesson, Assignment,
-    AssignmentSubmission, Quiz, Question, QuizAttempt, QuizAnswer,
+    AssignmentSubmission, Quiz, Question, QuizAttempt, QuizBestAttempt, QuizAnswer,
     Badge, StudentBadge, Discussion, DiscussionReply
 )
+from .progress import deferred_progress
+
+class DeferredProgressAdminMixin:
+    """Run bulk admin deletes with one consolidated progress recompute instead of a per-row cascade"""
+    
+    def delete_queryset(self, request, queryset):
+        with deferred_progress():
+            super().delete_queryset(request, queryset)
 
 @admin.register(User)
 class UserAdmin(BaseUserAdmin):
@@ -38,9 +46,15 @@ class CourseAdmin(admin.ModelAdmin):
 
 @admin.register(Enrollment)
 class EnrollmentAdmin(admin.ModelAdmin):
-    list_display = ('student', 'course', 'enrolled_at', 'progress')
+    list_display = ('student', 'course', 'enrolled_at', 'progress', 'completed_items', 'total_items')
     list_filter = ('enrolled_at',)
     search_fields = ('student__username', 'course__title')
+    actions = ['reconcile_progress']
+    
+    @admin.action(description='Recount progress for selected enrollments')
+    def reconcile_progress(self, request, queryset):
+        updated = Enrollment.reconcile_counters(queryset)
+        self.message_user(request, f'Recounted progress for {updated} enrollments.')
 
 @admin.register(Module)
 class ModuleAdmin(admin.ModelAdmin):
@@ -61,14 +75,14 @@ class AssignmentAdmin(admin.ModelAdmin):
     search_fields = ('title', 'description')
 
 @admin.register(AssignmentSubmission)
-class AssignmentSubmissionAdmin(admin.ModelAdmin):
+class AssignmentSubmissionAdmin(DeferredProgressAdminMixin, admin.ModelAdmin):
     list_display = ('student', 'assignment', 'submitted_at', 'marks', 'graded_at')
     list_filter = ('submitted_at', 'graded_at')
     search_fields = ('student__username', 'assignment__title')
 
 @admin.register(Quiz)
 class QuizAdmin(admin.ModelAdmin):
-    list_display = ('title', 'course', 'duration_minutes', 'max_marks', 'pass_marks')
+    list_display = ('title', 'course', 'duration_minutes', 'max_marks', 'pass_marks', 'max_attempts')
     list_filter = ('course', 'created_at')
     search_fields = ('title', 'description')
 
@@ -79,11 +93,19 @@ class QuestionAdmin(admin.ModelAdmin):
     search_fields = ('question_text',)
 
 @admin.register(QuizAttempt)
-class QuizAttemptAdmin(admin.ModelAdmin):
+class QuizAttemptAdmin(DeferredProgressAdminMixin, admin.ModelAdmin):
     list_display = ('student', 'quiz', 'started_at', 'submitted_at', 'score', 'is_completed')
     list_filter = ('is_completed', 'started_at', 'submitted_at')
     search_fields = ('student__username', 'quiz__title')
 
+@admin.register(QuizBestAttempt)
+class QuizBestAttemptAdmin(admin.ModelAdmin):
+    list_display = ('student', 'quiz', 'score', 'percentage', 'passed', 'attempt_count', 'updated_at')
+    list_filter = ('passed',)
+    search_fields = ('student__username', 'quiz__title')
+    # Maintained from the attempts; edit or delete those instead
+    readonly_fields = ('student', 'quiz', 'attempt', 'score', 'percentage', 'passed', 'attempt_count', 'updated_at')
+
 @admin.register(QuizAnswer)
 class QuizAnswerAdmin(admin.ModelAdmin):
     list_display = ('attempt', 'question', 'selected_answer', 'is_correct')
@@ -0,0 +1,226 @@
+"""
+Quiz analytics: attempt score summaries and per-question item analysis.
+
+``attempt_summary`` aggregates a quiz's completed attempt scores in the
+database (mean, median, pass rate and a score histogram) and caches the
+rollup briefly.
+
+Per-question item analysis is computed with NumPy.
+
+For every question: difficulty (p-value, the share of attempts answering it
+correctly), discrimination (point-biserial correlation between answering it
+correctly and the score on the rest of the quiz) and how often each option was
+picked. Completed attempts are streamed in one columnar query and folded
+batch by batch (ANSWER_BATCH rows at a time) into additive sums that are
+cached per quiz version, so later calls only load the
+attempts submitted since the last fold. Editing questions moves the quiz
+version and starts a fresh fold, and so does the regrade that follows once it
+has re-marked the stored answers.
+"""
+from datetime import timedelta
+from itertools import islice
+
+import numpy as np
+from django.core.cache import cache
+from django.db.models import Avg, Case, Count, F, IntegerField, Q, Value, When
+from django.db.models.functions import Coalesce, Least
+from django.utils import timezone
+
+from .grading import ANSWER_KEY_TIMEOUT, OPTIONS, answer_key, quiz_version
+from .models import QuizAttempt
+
+OPTION_LABELS = sorted(OPTIONS)
+# Attempts are folded once they are this old, so slow transactions that commit
+# with an earlier submitted_at are never skipped by the watermark
+SETTLE_DELAY = timedelta(seconds=60)
+# Answer rows read from the database and folded at a time
+ANSWER_BATCH = 50000
+HISTOGRAM_BINS = 10
+SUMMARY_TIMEOUT = 60
+
+def attempt_summary(quiz):
+    """
+    Score statistics over a quiz's completed attempts, computed in the database.
+
+    Returns {'count', 'mean', 'median', 'pass_rate', 'histogram'} where the
+    histogram is a list of {'label', 'count', 'percent'} over equal-width score
+    bands. Cached for SUMMARY_TIMEOUT seconds.
+    """
+    cache_key = f'lms:attempt_summary:{quiz.pk}:{quiz_version(quiz.pk)}:{quiz.max_marks}:{quiz.pass_marks}'
+    summary = cache.get(cache_key)
+    if summary is not None:
+        return summary
+
+    completed = QuizAttempt.objects.filter(quiz=quiz, is_completed=True, score__isnull=False).order_by()
+    totals = completed.aggregate(
+        count=Count('pk'),
+        mean=Avg('score'),
+        passed=Count('pk', filter=Q(score__gte=quiz.pass_marks)),
+    )
+    count = totals['count']
+
+    median = None
+    if count:
+        # Middle value(s) via an indexed ORDER BY ... OFFSET
+        middle = list(completed.order_by('score').values_list('score', flat=True)[(count - 1) // 2:count // 2 + 1])
+        median = sum(middle) / len(middle)
+
+    max_marks = max(quiz.max_marks, 1)
+    # Full marks (or more) fall in the top band
+    bin_counts = dict(
+        completed.annotate(bin=Least(Value(HISTOGRAM_BINS - 1), F('score') * HISTOGRAM_BINS / max_marks))
+        .values('bin')
+        .annotate(total=Count('pk'))
+        .values_list('bin', 'total')
+    )
+    histogram = []
+    for index in range(HISTOGRAM_BINS):
+        low = index * 100 // HISTOGRAM_BINS
+        high = (index + 1) * 100 // HISTOGRAM_BINS
+        total = bin_counts.get(index, 0)
+        histogram.append({
+            'label': f'{low}-{high}%',
+            'count': total,
+            'percent': total * 100 / count if count else 0,
+        })
+
+    summary = {
+        'count': count,
+        'mean': totals['mean'],
+        'median': median,
+        'pass_rate': totals['passed'] * 100 / count if count else None,
+        'histogram': histogram,
+    }
+    cache.set(cache_key, summary, SUMMARY_TIMEOUT)
+    return summary
+
+def _answer_batches(quiz_id, since, until):
+    """
+    (attempt_id, question_id, option index, is_correct) rows as int64 arrays of
+    about ANSWER_BATCH rows; -1 marks a missing value. The rows of an attempt
+    are never split across batches.
+    """
+    attempts = QuizAttempt.objects.filter(quiz=quiz_id, is_completed=True, submitted_at__lte=until)
+    if since is not None:
+        attempts = attempts.filter(submitted_at__gt=since)
+    rows = attempts.order_by().annotate(
+        question=Coalesce('answers__question_id', Value(-1)),
+        option=Case(
+            *[When(answers__selected_answer=label, then=Value(index)) for index, label in enumerate(OPTION_LABELS)],
+            default=Value(-1),
+            output_field=IntegerField()
+        ),
+        correct=Case(When(answers__is_correct=True, then=Value(1)), default=Value(0), output_field=IntegerField()),
+    ).order_by('pk').values_list('pk', 'question', 'option', 'correct').iterator(chunk_size=ANSWER_BATCH)
+
+    row = np.dtype((np.int64, 4))
+    pending = np.empty((0, 4), dtype=np.int64)
+    while True:
+        batch = np.fromiter(islice(rows, ANSWER_BATCH), dtype=row)
+        answers = np.concatenate([pending, batch])
+        if len(batch) < ANSWER_BATCH:
+            if len(answers):
+                yield answers
+            return
+        # The last attempt's rows may continue in the next batch
+        split = np.searchsorted(answers[:, 0], answers[-1, 0])
+        if split:
+            yield answers[:split]
+        pending = answers[split:]
+
+def _empty_sums(item_count):
+    return {
+        'attempts': 0,
+        'sum_score': 0.0,
+        'sum_score_sq': 0.0,
+        'correct': np.zeros(item_count, dtype=np.int64),
+        'sum_score_correct': np.zeros(item_count, dtype=np.float64),
+        'options': np.zeros((item_count, len(OPTION_LABELS)), dtype=np.int64),
+        'watermark': None,
+    }
+
+def _fold(sums, answers, question_ids, marks):
+    """Add a batch of answer rows to the running sums in place"""
+    if not len(answers):
+        return
+    attempt_ids, attempt_index = np.unique(answers[:, 0], return_inverse=True)
+    columns = np.searchsorted(question_ids, answers[:, 1])
+    known = columns < len(question_ids)
+    known[known] = question_ids[columns[known]] == answers[known, 1]
+    rows, columns, answers = attempt_index[known], columns[known], answers[known]
+
+    correct = np.zeros((len(attempt_ids), len(question_ids)), dtype=np.int8)
+    correct[rows, columns] = answers[:, 3]
+    scores = correct @ marks
+
+    sums['attempts'] += len(attempt_ids)
+    sums['sum_score'] += float(scores.sum())
+    sums['sum_score_sq'] += float(scores @ scores)
+    sums['correct'] += correct.sum(axis=0, dtype=np.int64)
+    sums['sum_score_correct'] += correct.T @ scores
+    picked = answers[:, 2] >= 0
+    np.add.at(sums['options'], (columns[picked], answers[picked, 2]), 1)
+
+def _statistics(sums, marks):
+    """p-values, corrected point-biserial discrimination and option frequencies from the sums"""
+    n = sums['attempts']
+    correct = sums['correct'].astype(np.float64)
+    p_values = correct / n
+
+    # Correlate with the rest score (total minus the item's own marks) so an item
+    # does not correlate with itself
+    rest_sum = sums['sum_score'] - marks * correct
+    rest_sum_sq = sums['sum_score_sq'] - 2 * marks * sums['sum_score_correct'] + marks ** 2 * correct
+    rest_sum_correct = sums['sum_score_correct'] - marks * correct
+    covariance = rest_sum_correct / n - p_values * rest_sum / n
+    rest_variance = rest_sum_sq / n - (rest_sum / n) ** 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        discrimination = covariance / np.sqrt(p_values * (1 - p_values) * rest_variance)
+    discrimination[~np.isfinite(discrimination)] = np.nan
+
+    option_frequencies = sums['options'] / n
+    omitted = 1 - option_frequencies.sum(axis=1)
+    return p_values, discrimination, option_frequencies, omitted
+
+def item_analysis(quiz_id):
+    """
+    Item statistics for a quiz's completed attempts.
+
+    Returns {'attempts': n, 'questions': {question_id: {'p_value', 'discrimination',
+    'options': {label: share, ..., 'omitted': share}}}}; discrimination is None
+    where it is undefined (every attempt right or wrong, or no score variance).
+    """
+    key = answer_key(quiz_id)
+    question_ids = np.array(sorted(key), dtype=np.int64)
+    marks = np.array([key[question_id][1] for question_id in question_ids], dtype=np.float64)
+
+    cache_key = f'lms:item_analysis:{quiz_id}:{quiz_version(quiz_id)}'
+    sums = cache.get(cache_key)
+    if sums is None or len(sums['correct']) != len(question_ids):
+        sums = _empty_sums(len(question_ids))
+
+    until = timezone.now() - SETTLE_DELAY
+    for answers in _answer_batches(quiz_id, sums['watermark'], until):
+        _fold(sums, answers, question_ids, marks)
+    sums['watermark'] = until
+    cache.set(cache_key, sums, ANSWER_KEY_TIMEOUT)
+
+    # Attempts inside the settle window are included in this result but not cached
+    result = {name: value.copy() if isinstance(value, np.ndarray) else value for name, value in sums.items()}
+    for answers in _answer_batches(quiz_id, until, timezone.now()):
+        _fold(result, answers, question_ids, marks)
+
+    if not result['attempts'] or not len(question_ids):
+        return {'attempts': result['attempts'], 'questions': {}}
+
+    p_values, discrimination, option_frequencies, omitted = _statistics(result, marks)
+    questions = {}
+    for index, question_id in enumerate(question_ids.tolist()):
+        options = dict(zip(OPTION_LABELS, option_frequencies[index].tolist()))
+        options['omitted'] = float(omitted[index])
+        questions[question_id] = {
+            'p_value': float(p_values[index]),
+            'discrimination': None if np.isnan(discrimination[index]) else float(discrimination[index]),
+            'options': options,
+        }
+    return {'attempts': result['attempts'], 'questions': questions}
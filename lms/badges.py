@@ -0,0 +1,181 @@
+"""
+Declarative badge rules.
+
+Rules are registered with the ``badge_rule`` decorator against an event name
+('assignment_graded', 'quiz_completed', 'course_completed', ...). ``award_badges``
+evaluates every rule for an event in memory, resolves the matching badges from
+the cached ``badge_catalog`` and inserts the new awards with a single
+bulk_create backed by the unique (student, badge, course) constraint. Other modules can register extra
+rules without touching the signal receivers.
+"""
+import threading
+from collections import defaultdict
+
+from .caching import get_version
+from .dashboards import invalidate_student_dashboards
+from .models import Badge, StudentBadge, StudentProfile
+
+_rules = defaultdict(list)
+
+class BadgeCatalog:
+    """
+    Process-local copy of the Badge table, keyed by pk and by (badge_type, name).
+
+    Loaded lazily and reloaded whenever the shared 'badges' version stamp moves,
+    which the Badge save/delete receivers bump. Steady-state lookups cost no queries.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._by_pk = {}
+        self._by_key = {}
+
+    def _fresh(self):
+        version = get_version('badges')
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    badges = list(Badge.objects.order_by('pk'))
+                    by_key = {}
+                    for badge in badges:
+                        by_key.setdefault((badge.badge_type, badge.name), badge)
+                    self._by_pk = {badge.pk: badge for badge in badges}
+                    self._by_key = by_key
+                    self._version = version
+        return self
+
+    def all(self):
+        return list(self._fresh()._by_pk.values())
+
+    def get(self, badge_type, name):
+        return self._fresh()._by_key.get((badge_type, name))
+
+    def get_by_pk(self, pk):
+        return self._fresh()._by_pk.get(pk)
+
+badge_catalog = BadgeCatalog()
+
+class BadgeRule:
+    """A badge awarded for an event whenever its predicate holds for the event's instance"""
+
+    def __init__(self, event, name, badge_type, description, icon, predicate):
+        self.event = event
+        self.name = name
+        self.badge_type = badge_type
+        self.description = description
+        self.icon = icon
+        self.predicate = predicate
+
+    @property
+    def key(self):
+        return (self.badge_type, self.name)
+
+    def __repr__(self):
+        return f"<BadgeRule {self.event}: {self.name}>"
+
+def badge_rule(event, name, badge_type, description='', icon='🏆'):
+    """Register the decorated predicate(instance) -> bool as a badge rule for event"""
+    def decorator(predicate):
+        _rules[event].append(BadgeRule(event, name, badge_type, description, icon, predicate))
+        return predicate
+    return decorator
+
+def rules_for(event):
+    return list(_rules.get(event, ()))
+
+def _resolve_badges(rules):
+    """Map rule keys to Badge rows from the catalog, creating any badge that does not exist yet"""
+    badges = {}
+    for rule in rules:
+        badge = badge_catalog.get(*rule.key)
+        if badge is None:
+            badge, _ = Badge.objects.get_or_create(
+                name=rule.name,
+                badge_type=rule.badge_type,
+                defaults={'description': rule.description, 'icon': rule.icon}
+            )
+        badges[rule.key] = badge
+    return badges
+
+def award_badges(event, instance, student_id, course_id):
+    """Evaluate the rules for one event and award the matching badges"""
+    return award_badges_many(event, [(instance, student_id, course_id)])
+
+def award_badges_many(event, items):
+    """
+    Evaluate the rules for a batch of (instance, student_id, course_id) items.
+
+    Costs a constant number of queries regardless of how many rules match:
+    existing-award lookup, one bulk insert and profile counter updates (badges
+    come from the cached catalog).
+    Returns the newly created StudentBadge objects.
+    """
+    rules = rules_for(event)
+    matches = [
+        (rule, student_id, course_id)
+        for instance, student_id, course_id in items
+        for rule in rules
+        if rule.predicate(instance)
+    ]
+    if not matches:
+        return []
+
+    badges = _resolve_badges({rule for rule, _, _ in matches})
+    candidates = {(student_id, badges[rule.key].pk, course_id) for rule, student_id, course_id in matches}
+
+    existing = set(
+        StudentBadge.objects.filter(
+            student__in={student_id for student_id, _, _ in candidates},
+            badge__in={badge_id for _, badge_id, _ in candidates},
+            course__in={course_id for _, _, course_id in candidates},
+        ).values_list('student_id', 'badge_id', 'course_id')
+    )
+    new_awards = [
+        StudentBadge(student_id=student_id, badge_id=badge_id, course_id=course_id, is_instructor_awarded=False)
+        for student_id, badge_id, course_id in sorted(candidates - existing)
+    ]
+    if not new_awards:
+        return []
+
+    StudentBadge.objects.bulk_create(new_awards, ignore_conflicts=True)
+    # bulk_create skips post_save, so count the awards on the profiles here
+    StudentProfile.add_counts('total_badges_earned', [award.student_id for award in new_awards])
+    invalidate_student_dashboards({award.student_id for award in new_awards})
+    return new_awards
+
+def award_course_completion_badges(enrollments):
+    """Award the course completion badge to every enrollment in the queryset at 100%"""
+    completed = enrollments.filter(progress__gte=100).values_list('student_id', 'course_id')
+    return award_badges_many('course_completed', [(None, student_id, course_id) for student_id, course_id in completed])
+
+# Default rules
+
+def _percentage(obtained, maximum):
+    if not obtained or not maximum:
+        return 0
+    return (obtained / maximum) * 100
+
+@badge_rule('assignment_graded', 'Assignment Completed', 'assignment_ace', 'Completed an assignment', '✅')
+def assignment_completed(submission):
+    return True
+
+@badge_rule('assignment_graded', 'Assignment Ace', 'assignment_ace', 'Scored 90%+ on assignment', '📝')
+def assignment_ace(submission):
+    return _percentage(submission.marks, submission.assignment.max_marks) >= 90
+
+@badge_rule('quiz_completed', 'Quiz Completed', 'quiz_master', 'Completed a quiz', '✅')
+def quiz_completed(attempt):
+    return True
+
+@badge_rule('quiz_completed', 'Quiz Master', 'quiz_master', 'Scored 90%+ on quiz', '🧠')
+def quiz_master(attempt):
+    return _percentage(attempt.score, attempt.quiz.max_marks) >= 90
+
+@badge_rule('quiz_completed', 'Perfect Score', 'perfect_score', 'Achieved 100% score', '💯')
+def perfect_score(attempt):
+    return _percentage(attempt.score, attempt.quiz.max_marks) == 100
+
+@badge_rule('course_completed', 'Course Completion', 'course_complete', 'Completed all assignments and quizzes', '🎓')
+def course_completed(enrollment):
+    return True
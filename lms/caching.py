@@ -0,0 +1,68 @@
+"""
+Version stamps kept in the shared cache.
+
+Cached data is keyed by (or tagged with) a version stamp; bumping the stamp
+invalidates it for every worker process at once without touching the database.
+Stamps start with the time they were issued, so they can also serve as
+Last-Modified dates.
+"""
+import hashlib
+import time
+import uuid
+
+from django.core.cache import cache
+
+def _version_key(name):
+    return f'lms:version:{name}'
+
+def _new_version():
+    return f'{time.time_ns() // 1_000_000:x}.{uuid.uuid4().hex[:16]}'
+
+def _issued_ms(version):
+    issued, separator, _ = str(version).partition('.')
+    if not separator:
+        return None
+    try:
+        return int(issued, 16)
+    except ValueError:
+        return None
+
+def version_timestamp(version):
+    """Unix time (in seconds) at which a stamp was issued, or None for stamps that carry none"""
+    issued = _issued_ms(version)
+    return None if issued is None else issued // 1000
+
+def combine_versions(versions):
+    """One stamp that moves whenever any of versions does, issued at the newest of their times"""
+    versions = [str(version) for version in versions]
+    digest = hashlib.sha256(':'.join(versions).encode()).hexdigest()[:16]
+    issued = [_issued_ms(version) for version in versions]
+    if None in issued:
+        return digest
+    return f'{max(issued):x}.{digest}'
+
+def get_version(name):
+    """Current version stamp for name, creating one if the cache has none"""
+    key = _version_key(name)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _new_version(), timeout=None)
+        version = cache.get(key)
+    return version
+
+def get_versions(names):
+    """{name: current version stamp} for several names with one cache read, creating those the cache has none for"""
+    keys = {_version_key(name): name for name in names}
+    versions = cache.get_many(keys)
+    for key in keys.keys() - versions.keys():
+        cache.add(key, _new_version(), timeout=None)
+        versions[key] = cache.get(key)
+    return {name: versions[key] for key, name in keys.items()}
+
+def bump_version(name):
+    """Invalidate everything cached under name's current version stamp"""
+    cache.set(_version_key(name), _new_version(), timeout=None)
+
+def bump_versions(names):
+    """Invalidate several version stamps with one cache write"""
+    cache.set_many({_version_key(name): _new_version() for name in names}, timeout=None)
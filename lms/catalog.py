@@ -0,0 +1,55 @@
+"""
+The published course catalog.
+
+Catalog pages are keyset-paginated newest first (``?before=<course id>``) and
+built from one annotated Course query carrying module, lesson, quiz and
+enrollment counts. Pages hold nothing user-specific, so each is cached once
+and shared by every student, keyed by the 'catalog' version stamp. The stamp
+is bumped when a course or its modules, lessons or quizzes change; enrollment
+counts are allowed to lag by up to CATALOG_TIMEOUT seconds rather than
+invalidating every page on each enrollment.
+"""
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import OuterRef
+
+from .caching import bump_version, get_version
+from .models import Course, Enrollment, Lesson, Module, Quiz, _count_subquery
+
+CATALOG_PAGE_SIZE = 24
+CATALOG_TIMEOUT = 60 * 5
+
+def catalog_version():
+    """Current version stamp of the published course catalog"""
+    return get_version('catalog')
+
+def invalidate_catalog():
+    transaction.on_commit(lambda: bump_version('catalog'))
+
+def annotated_courses(courses):
+    """The courses queryset with its instructor and module, lesson, quiz and enrollment counts"""
+    course = OuterRef('pk')
+    return courses.select_related('instructor').annotate(
+        module_count=_count_subquery(Module.objects.filter(course=course), 'course'),
+        lesson_count=_count_subquery(Lesson.objects.filter(module__course=course), 'module__course'),
+        quiz_count=_count_subquery(Quiz.objects.filter(course=course), 'course'),
+        enrollment_count=_count_subquery(Enrollment.objects.filter(course=course), 'course'),
+    )
+
+def course_page(courses, before=None, page_size=CATALOG_PAGE_SIZE):
+    """One keyset page of the courses queryset, newest first; returns (courses, next_before)"""
+    courses = annotated_courses(courses).order_by('-id')
+    if before is not None:
+        courses = courses.filter(id__lt=before)
+    page = list(courses[:page_size + 1])
+    next_before = page[page_size - 1].id if len(page) > page_size else None
+    return page[:page_size], next_before
+
+def catalog_page(before=None):
+    """course_page over the published courses, cached and shared by every student"""
+    key = f'lms:catalog:{catalog_version()}:{before or "first"}'
+    page = cache.get(key)
+    if page is None:
+        page = course_page(Course.objects.filter(is_published=True), before)
+        cache.set(key, page, CATALOG_TIMEOUT)
+    return page
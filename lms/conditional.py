@@ -0,0 +1,43 @@
+"""
+Conditional GET for content pages.
+
+Content pages carry a strong ETag hashed from the viewing user and the version
+stamps of everything they render (navigation and per-student overlays differ
+between users), and a Last-Modified date from the newest stamp. Views check
+access, then call ``not_modified`` before loading or rendering anything and
+answer 304 when the client's copy is current.
+"""
+import hashlib
+
+from django.contrib.messages import get_messages
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from .caching import version_timestamp
+
+class ContentValidators:
+    """ETag and Last-Modified of a page rendered for user from content at the given version stamps"""
+
+    def __init__(self, user, *versions):
+        digest = hashlib.sha256(':'.join([str(user.pk), *map(str, versions)]).encode()).hexdigest()
+        self.etag = f'"{digest[:32]}"'
+        timestamps = [version_timestamp(version) for version in versions]
+        self.last_modified = None if None in timestamps else max(timestamps, default=None)
+
+    def not_modified(self, request):
+        """A 304 response when the client's copy is current, else None"""
+        # Pending messages are only shown on a full render
+        if request.method not in ('GET', 'HEAD') or len(get_messages(request)):
+            return None
+        response = get_conditional_response(request, etag=self.etag, last_modified=self.last_modified)
+        if response is not None:
+            self.apply(response)
+        return response
+
+    def apply(self, response):
+        """Set the validators on a response and have clients revalidate before reusing it"""
+        response.headers['ETag'] = self.etag
+        if self.last_modified is not None:
+            response.headers['Last-Modified'] = http_date(self.last_modified)
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
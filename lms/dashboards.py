@@ -0,0 +1,192 @@
+"""
+Cached dashboard data.
+
+The instructor dashboard reads every per-course statistic from one annotated
+Course query, optionally cached per instructor for a few seconds
+(``LMS_INSTRUCTOR_DASHBOARD_TIMEOUT``) under a version stamp that course
+saves and deletes bump.
+
+The student dashboard is rendered inside a per-user template fragment cache
+keyed by the student's dashboard version and the shared catalog stamp.
+``StudentDashboard`` assembles its data lazily, so a warm render reads only
+stamps from the cache and never queries the database. The dashboard version
+folds the student's own stamp, bumped on commit whenever their enrollments,
+progress, grades, quiz attempts or badges change, with one stamp per enrolled
+course, bumped when the course or its content changes. A course edit thus
+writes a single cache key however many students are enrolled. See
+``lms.catalog`` for the catalog stamp.
+"""
+from functools import cached_property
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Avg, FloatField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .caching import bump_version, bump_versions, combine_versions, get_version, get_versions
+from .models import (
+    Assignment, AssignmentSubmission, Course, Enrollment, Module, Quiz, QuizAttempt, StudentBadge, _count_subquery
+)
+
+DASHBOARD_TIMEOUT = 60 * 60
+RECENT_ITEMS = 5
+AVAILABLE_COURSES = 6
+
+def _student_version_name(student_id):
+    return f'student_dashboard:{student_id}'
+
+def _course_version_name(course_id):
+    return f'course_dashboards:{course_id}'
+
+def _student_course_ids(student_id, version):
+    """Ids of a student's courses, cached under their own stamp since enrollment changes move it"""
+    key = f'lms:student_dashboard_courses:{student_id}:{version}'
+    course_ids = cache.get(key)
+    if course_ids is None:
+        course_ids = list(Enrollment.objects.filter(student=student_id).values_list('course_id', flat=True))
+        cache.set(key, course_ids, DASHBOARD_TIMEOUT)
+    return course_ids
+
+def student_dashboard_version(student_id):
+    """Current version of a student's dashboard: their own stamp combined with those of their courses"""
+    version = get_version(_student_version_name(student_id))
+    course_ids = _student_course_ids(student_id, version)
+    if not course_ids:
+        return version
+    course_versions = get_versions(_course_version_name(course_id) for course_id in course_ids)
+    return combine_versions([version, *course_versions.values()])
+
+def invalidate_student_dashboards(student_ids):
+    """Drop the cached dashboards of the given students once the current transaction commits"""
+    names = {_student_version_name(student_id) for student_id in student_ids}
+    if names:
+        transaction.on_commit(lambda: bump_versions(names))
+
+def invalidate_course_dashboards(course_id):
+    """Drop the cached dashboards of every student enrolled in a course once the current transaction commits"""
+    transaction.on_commit(lambda: bump_version(_course_version_name(course_id)))
+
+def _instructor_version_name(instructor_id):
+    return f'instructor_dashboard:{instructor_id}'
+
+def invalidate_instructor_dashboard(instructor_id):
+    """Drop an instructor's cached course statistics once the current transaction commits"""
+    transaction.on_commit(lambda: bump_version(_instructor_version_name(instructor_id)))
+
+class StudentDashboard:
+    """Lazily loaded student dashboard data; each attribute costs one query the first time it is read"""
+
+    def __init__(self, student):
+        self.student = student
+
+    @cached_property
+    def enrollments(self):
+        course = OuterRef('course')
+        return list(
+            Enrollment.objects.filter(student=self.student)
+            .select_related('course')
+            .annotate(
+                module_count=_count_subquery(Module.objects.filter(course=course), 'course'),
+                assignment_count=_count_subquery(Assignment.objects.filter(course=course), 'course'),
+                quiz_count=_count_subquery(Quiz.objects.filter(course=course), 'course'),
+            )
+            .order_by('pk')
+        )
+
+    @cached_property
+    def course_ids(self):
+        return [enrollment.course_id for enrollment in self.enrollments]
+
+    @property
+    def total_enrollments(self):
+        return len(self.enrollments)
+
+    @property
+    def total_assignments(self):
+        return sum(enrollment.assignment_count for enrollment in self.enrollments)
+
+    @property
+    def total_quizzes(self):
+        return sum(enrollment.quiz_count for enrollment in self.enrollments)
+
+    @cached_property
+    def available_courses(self):
+        return list(
+            Course.objects.filter(is_published=True)
+            .exclude(enrollments__student=self.student)
+            .select_related('instructor')
+            .annotate(module_count=_count_subquery(Module.objects.filter(course=OuterRef('pk')), 'course'))
+            .order_by('pk')[:AVAILABLE_COURSES]
+        )
+
+    @cached_property
+    def recent_assignments(self):
+        if not self.course_ids:
+            return []
+        return list(
+            Assignment.objects.filter(course__in=self.course_ids)
+            .select_related('course')
+            .order_by('-due_date', '-pk')[:RECENT_ITEMS]
+        )
+
+    @cached_property
+    def recent_quizzes(self):
+        if not self.course_ids:
+            return []
+        return list(
+            Quiz.objects.filter(course__in=self.course_ids)
+            .select_related('course')
+            .order_by('-created_at', '-pk')[:RECENT_ITEMS]
+        )
+
+    @cached_property
+    def earned_badges(self):
+        return list(StudentBadge.objects.filter(student=self.student).select_related('badge'))
+
+def instructor_courses(instructor):
+    """
+    An instructor's courses annotated with their dashboard statistics in one query.
+
+    Each course gets student_count, average_progress, ungraded_submissions,
+    pending_attempts (open quiz attempts), assignment_count and quiz_count.
+    """
+    course = OuterRef('pk')
+    average_progress = (
+        Enrollment.objects.filter(course=course)
+        .order_by()
+        .values('course')
+        .annotate(average=Avg('progress'))
+        .values('average')[:1]
+    )
+    return list(
+        Course.objects.filter(instructor=instructor)
+        .annotate(
+            student_count=_count_subquery(Enrollment.objects.filter(course=course), 'course'),
+            average_progress=Coalesce(Subquery(average_progress), Value(0.0), output_field=FloatField()),
+            ungraded_submissions=_count_subquery(
+                AssignmentSubmission.objects.filter(assignment__course=course, marks__isnull=True),
+                'assignment__course'
+            ),
+            pending_attempts=_count_subquery(
+                QuizAttempt.objects.filter(quiz__course=course, is_completed=False),
+                'quiz__course'
+            ),
+            assignment_count=_count_subquery(Assignment.objects.filter(course=course), 'course'),
+            quiz_count=_count_subquery(Quiz.objects.filter(course=course), 'course'),
+        )
+        .order_by('pk')
+    )
+
+def instructor_dashboard_courses(instructor):
+    """instructor_courses, cached for LMS_INSTRUCTOR_DASHBOARD_TIMEOUT seconds when that is set"""
+    timeout = getattr(settings, 'LMS_INSTRUCTOR_DASHBOARD_TIMEOUT', 0)
+    if not timeout:
+        return instructor_courses(instructor)
+    # Versioned so courses added, edited or deleted show up at once
+    key = f'lms:instructor_dashboard:{instructor.pk}:{get_version(_instructor_version_name(instructor.pk))}'
+    courses = cache.get(key)
+    if courses is None:
+        courses = instructor_courses(instructor)
+        cache.set(key, courses, timeout)
+    return courses
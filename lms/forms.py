@@ -2,9 +2,10 @@ from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from .models import (
     User, Course, Module, Lesson, Assignment, AssignmentSubmission,
-    Quiz, Question, QuizAnswer, Badge, StudentBadge,
+    Quiz, Question, QuizAnswer, Badge,
     StudentProfile, InstructorProfile, LessonProgress, ModuleProgress
 )
+from .badges import badge_catalog
 
 class UserRegisterForm(forms.Form):
     ROLE_CHOICES = [
@@ -176,7 +177,7 @@ class GradeAssignmentForm(forms.ModelForm):
 class QuizForm(forms.ModelForm):
     class Meta:
         model = Quiz
-        fields = ['title', 'description', 'duration_minutes', 'max_marks', 'pass_marks']
+        fields = ['title', 'description', 'duration_minutes', 'max_marks', 'pass_marks', 'max_attempts']
         widgets = {
             'description': forms.Textarea(attrs={'rows': 3}),
         }
@@ -199,16 +200,27 @@ class QuestionForm(forms.ModelForm):
         for field in self.fields:
             self.fields[field].widget.attrs.update({'class': 'form-input'})
 
-class AwardBadgeForm(forms.ModelForm):
+class BadgeChoiceField(forms.ChoiceField):
+    """Badge picker served from the cached badge catalog instead of a Badge queryset"""
+    
+    def __init__(self, **kwargs):
+        super().__init__(choices=self._badge_choices, **kwargs)
+    
+    @staticmethod
+    def _badge_choices():
+        return [('', '---------')] + [(badge.pk, str(badge)) for badge in badge_catalog.all()]
+    
+    def clean(self, value):
+        value = super().clean(value)
+        return badge_catalog.get_by_pk(int(value)) if value else None
+
+class AwardBadgeForm(forms.Form):
+    badge = BadgeChoiceField()
     note = forms.CharField(
         widget=forms.Textarea(attrs={'rows': 3, 'placeholder': 'Optional note for the student...'}),
         required=False
     )
     
-    class Meta:
-        model = StudentBadge
-        fields = ['badge', 'note']
-    
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.fields['badge'].widget.attrs.update({'class': 'form-input'})
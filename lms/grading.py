@@ -0,0 +1,372 @@
+"""
+Quiz grading against cached answer keys.
+
+Each quiz's answer key (correct option and marks per question) is cached under
+the quiz's version stamp, which the Question save/delete receivers bump, so
+grading a submission reads no questions from the database. Answers are scored
+in memory and upserted with one bulk_create on the unique (attempt, question)
+key, both while the student works (autosave) and at submission, where the
+attempt is finalized with a single conditional UPDATE inside one transaction.
+That UPDATE also stores the attempt's result summary, so result pages and
+reports render from the attempt row alone.
+
+Each completion is folded into the student's QuizBestAttempt row in the same
+transaction, so progress, badges and gradebooks read one row per (student,
+quiz) however many attempts the quiz allows.
+
+Attempts carry a deadline from the quiz's time limit. Answers arriving after it
+(plus a short grace for the client's auto-submit) are not accepted, and the
+``expire_quiz_attempts`` command finalizes abandoned attempts in batches,
+grading whatever was autosaved.
+
+When a question's correct answer or marks change (or it is deleted) the quiz is
+flagged for a set-based regrade, run by the ``regrade_quizzes`` command or on
+commit when the progress queue is eager.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, router, transaction
+from django.db.models import Case, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_save
+from django.utils import timezone
+
+from .badges import award_badges_many
+from .caching import bump_version, get_version
+from .models import Enrollment, Question, Quiz, QuizAnswer, QuizAttempt, QuizBestAttempt
+from .progress import defer, deferred_progress, recompute
+
+ANSWER_KEY_TIMEOUT = 60 * 60 * 24
+REGRADE_CHUNK_SIZE = 2000
+EXPIRY_BATCH_SIZE = 500
+# Allowance for the auto-submit sent by the client timer when the deadline hits
+DEADLINE_GRACE = timedelta(seconds=getattr(settings, 'LMS_QUIZ_DEADLINE_GRACE', 30))
+SUMMARY_FIELDS = ['correct_count', 'total_marks', 'percentage', 'passed', 'result_bitmap']
+OPTIONS = frozenset(choice for choice, _ in QuizAnswer._meta.get_field('selected_answer').choices)
+
+def _quiz_version_name(quiz_id):
+    return f'quiz:{quiz_id}'
+
+def quiz_version(quiz_id):
+    """Current version stamp of a quiz's questions"""
+    return get_version(_quiz_version_name(quiz_id))
+
+def answer_key(quiz_id):
+    """{question_id: (correct_answer, marks)} for a quiz in question order, cached per quiz version"""
+    key = f'lms:quiz_answer_key:{quiz_id}:{quiz_version(quiz_id)}'
+    answers = cache.get(key)
+    if answers is None:
+        answers = {
+            question_id: (correct_answer, marks)
+            for question_id, correct_answer, marks in Question.objects.filter(quiz=quiz_id)
+            .order_by('order', 'pk')
+            .values_list('pk', 'correct_answer', 'marks')
+        }
+        cache.set(key, answers, ANSWER_KEY_TIMEOUT)
+    return answers
+
+def invalidate_answer_key(quiz_id):
+    """Move the quiz to a new version once the current transaction commits"""
+    transaction.on_commit(lambda: bump_version(_quiz_version_name(quiz_id)))
+
+def start_attempt(quiz, student):
+    """
+    Return the student's open attempt at a quiz, starting one if attempts are left.
+
+    An open attempt is resumed; otherwise a new one is started while the student
+    has completed fewer than quiz.max_attempts (read from their best-attempt
+    row), and their best attempt is returned once they are used up. Concurrent
+    calls for the same student are serialised on their enrollment row, and the
+    partial unique constraint on open attempts backs this up on databases
+    without row locks. Raises Enrollment.DoesNotExist if the student is not
+    enrolled. Returns (attempt, created).
+    """
+    with transaction.atomic():
+        Enrollment.objects.select_for_update().only('pk').get(student=student, course=quiz.course_id)
+        attempt = QuizAttempt.objects.filter(quiz=quiz, student=student, is_completed=False).first()
+        if attempt is not None:
+            return attempt, False
+        best = QuizBestAttempt.objects.filter(quiz=quiz, student=student).select_related('attempt').first()
+        if best is not None and best.attempt_count >= quiz.max_attempts:
+            return best.attempt, False
+        try:
+            with transaction.atomic():
+                return QuizAttempt.objects.create(
+                    quiz=quiz,
+                    student=student,
+                    deadline_at=timezone.now() + timedelta(minutes=quiz.duration_minutes)
+                ), True
+        except IntegrityError:
+            return QuizAttempt.objects.get(quiz=quiz, student=student, is_completed=False), False
+
+def accepts_answers(attempt):
+    """Whether an open attempt may still record answers, i.e. its deadline (plus grace) has not passed"""
+    return attempt.deadline_at is None or timezone.now() < attempt.deadline_at + DEADLINE_GRACE
+
+def score_answers(key, selections):
+    """Score {question_id: selected_answer} against an answer key; returns (unsaved QuizAnswers, score)"""
+    answers = []
+    score = 0
+    for question_id, selected_answer in selections.items():
+        if question_id not in key or selected_answer not in OPTIONS:
+            continue
+        correct_answer, marks = key[question_id]
+        is_correct = selected_answer == correct_answer
+        answers.append(QuizAnswer(
+            question_id=question_id,
+            selected_answer=selected_answer,
+            is_correct=is_correct
+        ))
+        if is_correct:
+            score += marks
+    return answers, score
+
+def result_summary(quiz, key, correctness, score):
+    """
+    Summary fields for an attempt at quiz with the given score.
+
+    correctness maps answered question ids to whether they were answered correctly.
+    """
+    return {
+        'correct_count': sum(1 for is_correct in correctness.values() if is_correct),
+        'total_marks': sum(marks for _, marks in key.values()),
+        'percentage': round(score / quiz.max_marks * 100, 2) if quiz.max_marks else 0.0,
+        'passed': score >= quiz.pass_marks,
+        'result_bitmap': ''.join(
+            '-' if question_id not in correctness else '1' if correctness[question_id] else '0'
+            for question_id in key
+        ),
+    }
+
+def summarize_attempts(attempts, chunk_size=REGRADE_CHUNK_SIZE):
+    """Rebuild the stored result summary of every completed attempt in the queryset; returns rows updated"""
+    attempt_ids = list(attempts.filter(is_completed=True).order_by('pk').values_list('pk', flat=True))
+    for start in range(0, len(attempt_ids), chunk_size):
+        chunk = attempt_ids[start:start + chunk_size]
+        correctness = {attempt_id: {} for attempt_id in chunk}
+        for attempt_id, question_id, is_correct in QuizAnswer.objects.filter(attempt__in=chunk).values_list(
+            'attempt_id', 'question_id', 'is_correct'
+        ):
+            correctness[attempt_id][question_id] = is_correct
+
+        rows = list(QuizAttempt.objects.filter(pk__in=chunk).select_related('quiz'))
+        for attempt in rows:
+            summary = result_summary(attempt.quiz, answer_key(attempt.quiz_id), correctness[attempt.pk], attempt.score or 0)
+            for field, value in summary.items():
+                setattr(attempt, field, value)
+        QuizAttempt.objects.bulk_update(rows, SUMMARY_FIELDS, batch_size=500)
+    return len(attempt_ids)
+
+def _upsert_answers(answers):
+    QuizAnswer.objects.bulk_create(
+        answers,
+        update_conflicts=True,
+        unique_fields=['attempt', 'question'],
+        update_fields=['selected_answer', 'is_correct']
+    )
+
+def _lock_open_attempt(attempt):
+    """
+    Lock an attempt's row if it is still open; returns whether it is.
+
+    Every writer of an attempt's answers (autosave, submission, expiry sweep)
+    locks the attempt before its answers so none of them can deadlock another.
+    """
+    return QuizAttempt.objects.select_for_update().filter(pk=attempt.pk, is_completed=False).exists()
+
+def autosave_answers(attempt, selections):
+    """
+    Upsert the given {question_id: selected_answer} for an incomplete attempt.
+
+    A None selection clears the question's stored answer. Returns how many
+    answers were saved or cleared.
+    """
+    key = answer_key(attempt.quiz_id)
+    answers, _ = score_answers(key, selections)
+    cleared = [question_id for question_id, answer in selections.items() if answer is None and question_id in key]
+    if not answers and not cleared:
+        return 0
+    for answer in answers:
+        answer.attempt = attempt
+    with transaction.atomic():
+        if not _lock_open_attempt(attempt):
+            return 0
+        if answers:
+            _upsert_answers(answers)
+        if cleared:
+            QuizAnswer.objects.filter(attempt=attempt, question_id__in=cleared).delete()
+    return len(answers) + len(cleared)
+
+def submit_attempt(attempt, selections):
+    """
+    Grade and finalize an incomplete attempt in one transaction.
+
+    Final selections override autosaved ones and the whole attempt is scored
+    against the current answer key; once the deadline has passed only the
+    autosaved answers count. The attempt row is locked before its answers are
+    written, and claimed with a conditional UPDATE, so concurrent or repeated
+    submissions (or the expiry sweep) grade it only once. Returns False (saving
+    nothing) if it was already completed.
+    """
+    using = router.db_for_write(QuizAttempt)
+    with transaction.atomic(using=using):
+        if not _lock_open_attempt(attempt):
+            return False
+        saved = dict(QuizAnswer.objects.filter(attempt=attempt).values_list('question_id', 'selected_answer'))
+        if accepts_answers(attempt):
+            saved.update({question_id: answer for question_id, answer in selections.items() if answer})
+        key = answer_key(attempt.quiz_id)
+        answers, score = score_answers(key, saved)
+        summary = result_summary(attempt.quiz, key, {answer.question_id: answer.is_correct for answer in answers}, score)
+        submitted_at = timezone.now()
+        for answer in answers:
+            answer.attempt = attempt
+        if answers:
+            _upsert_answers(answers)
+        claimed = QuizAttempt.objects.filter(pk=attempt.pk, is_completed=False).update(
+            score=score,
+            submitted_at=submitted_at,
+            is_completed=True,
+            **summary
+        )
+        if not claimed:
+            transaction.set_rollback(True, using=using)
+            return False
+
+        attempt.score = score
+        attempt.submitted_at = submitted_at
+        attempt.is_completed = True
+        for field, value in summary.items():
+            setattr(attempt, field, value)
+        # The UPDATE above bypasses save(), so run the completion receivers (progress, badges) explicitly
+        post_save.send(
+            sender=QuizAttempt,
+            instance=attempt,
+            created=False,
+            update_fields=frozenset({'score', 'submitted_at', 'is_completed', *SUMMARY_FIELDS}),
+            raw=False,
+            using=using
+        )
+    return True
+
+def expire_attempts(batch_size=EXPIRY_BATCH_SIZE):
+    """
+    Finalize up to batch_size open attempts whose deadline (plus grace) has passed.
+
+    Each attempt is graded on its autosaved answers with one answer upsert, one
+    bulk UPDATE and one best-attempt refresh for the batch. Attempts are
+    recorded as submitted now (their deadline stays in deadline_at), so item
+    analysis folds them in after its watermark. Rows locked by a submission or
+    autosave in flight are skipped. Progress and badges for the
+    whole batch run as one deferred recompute on commit. Returns the number of
+    attempts finalized.
+    """
+    now = timezone.now()
+    cutoff = now - DEADLINE_GRACE
+    with transaction.atomic(), deferred_progress():
+        expired = list(
+            QuizAttempt.objects.select_for_update(skip_locked=True)
+            .filter(is_completed=False, deadline_at__lt=cutoff)
+            .order_by('deadline_at')[:batch_size]
+        )
+        if not expired:
+            return 0
+
+        quizzes = Quiz.objects.in_bulk({attempt.quiz_id for attempt in expired})
+        saved = defaultdict(dict)
+        for attempt_id, question_id, selected_answer in QuizAnswer.objects.filter(attempt__in=expired).values_list(
+            'attempt_id', 'question_id', 'selected_answer'
+        ):
+            saved[attempt_id][question_id] = selected_answer
+
+        answers = []
+        for attempt in expired:
+            attempt.quiz = quizzes[attempt.quiz_id]
+            key = answer_key(attempt.quiz_id)
+            graded, score = score_answers(key, saved[attempt.pk])
+            for answer in graded:
+                answer.attempt = attempt
+            answers.extend(graded)
+            attempt.score = score
+            attempt.submitted_at = now
+            attempt.is_completed = True
+            summary = result_summary(attempt.quiz, key, {answer.question_id: answer.is_correct for answer in graded}, score)
+            for field, value in summary.items():
+                setattr(attempt, field, value)
+            attempt._was_completed = True
+            # bulk_update skips post_save, so buffer the attempt for the consolidated recompute directly
+            defer(attempt)
+
+        if answers:
+            _upsert_answers(answers)
+        QuizAttempt.objects.bulk_update(
+            expired, ['score', 'submitted_at', 'is_completed', *SUMMARY_FIELDS], batch_size=500
+        )
+        QuizBestAttempt.refresh((attempt.student_id, attempt.quiz_id) for attempt in expired)
+    return len(expired)
+
+def regrade_quiz(quiz_id):
+    """
+    Re-mark every answer of a quiz against its current questions and rescore its completed attempts.
+
+    One UPDATE fixes QuizAnswer.is_correct and one rescores the attempts from an
+    aggregated subquery; result summaries are rebuilt in chunks, and best attempts,
+    progress and badges are re-run only for the attempts whose score changed. The
+    quiz version moves on commit, dropping analysis cached from the old marking.
+    Returns the number of changed attempts.
+    """
+    attempts = QuizAttempt.objects.filter(quiz=quiz_id, is_completed=True)
+    correct_answer = Question.objects.filter(pk=OuterRef('question')).values('correct_answer')[:1]
+    earned = (
+        QuizAnswer.objects.filter(attempt=OuterRef('pk'), is_correct=True)
+        .order_by()
+        .values('attempt')
+        .annotate(total=Sum('question__marks'))
+        .values('total')[:1]
+    )
+    with transaction.atomic():
+        previous_scores = dict(attempts.values_list('pk', 'score'))
+        QuizAnswer.objects.filter(attempt__quiz=quiz_id).update(
+            is_correct=Case(When(selected_answer=Subquery(correct_answer), then=Value(True)), default=Value(False))
+        )
+        attempts.update(score=Coalesce(Subquery(earned), 0))
+        summarize_attempts(attempts)
+        # Marks changes move every best row's percentage and pass flag, not just the rescored ones
+        best_attempt = QuizAttempt.objects.filter(pk=OuterRef('attempt'))
+        QuizBestAttempt.objects.filter(quiz=quiz_id).update(
+            percentage=Subquery(best_attempt.values('percentage')[:1]),
+            passed=Subquery(best_attempt.values('passed')[:1])
+        )
+        changed = [pk for pk, score in attempts.values_list('pk', 'score') if score != previous_scores.get(pk)]
+        # Item analysis may have folded the pre-regrade answers under the current version
+        invalidate_answer_key(quiz_id)
+
+        for start in range(0, len(changed), REGRADE_CHUNK_SIZE):
+            regraded = list(attempts.filter(pk__in=changed[start:start + REGRADE_CHUNK_SIZE]).select_related('quiz'))
+            QuizBestAttempt.refresh((attempt.student_id, attempt.quiz_id) for attempt in regraded)
+            recompute({(attempt.student_id, attempt.quiz.course_id) for attempt in regraded})
+            award_badges_many('quiz_completed', [
+                (attempt, attempt.student_id, attempt.quiz.course_id) for attempt in regraded
+            ])
+    return len(changed)
+
+def request_regrade(quiz_id):
+    """Flag a quiz for regrading; regrades on commit instead when the progress queue is eager"""
+    Quiz.objects.filter(pk=quiz_id).update(regrade_requested_at=timezone.now())
+    if getattr(settings, 'LMS_PROGRESS_QUEUE_EAGER', False):
+        transaction.on_commit(lambda: process_regrades(quiz_ids=[quiz_id]))
+
+def process_regrades(limit=10, quiz_ids=None):
+    """Regrade up to limit flagged quizzes (optionally only the given ones); returns how many were regraded"""
+    flagged = Quiz.objects.filter(regrade_requested_at__isnull=False)
+    if quiz_ids is not None:
+        flagged = flagged.filter(pk__in=quiz_ids)
+    requested = list(flagged.order_by('regrade_requested_at').values_list('pk', 'regrade_requested_at')[:limit])
+    for quiz_id, requested_at in requested:
+        regrade_quiz(quiz_id)
+        # Keep the flag if the questions changed again while regrading
+        Quiz.objects.filter(pk=quiz_id, regrade_requested_at=requested_at).update(regrade_requested_at=None)
+    return len(requested)
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from lms.grading import summarize_attempts
+from lms.models import QuizAttempt
+
+class Command(BaseCommand):
+    help = 'Store result summaries on completed quiz attempts graded before summaries existed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--quiz', type=int, action='append', dest='quizzes',
+                            help='Only backfill this quiz (repeatable)')
+        parser.add_argument('--all', action='store_true', help='Rebuild summaries that are already stored too')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Attempts summarised per bulk update')
+
+    def handle(self, *args, **options):
+        attempts = QuizAttempt.objects.filter(is_completed=True)
+        if options['quizzes']:
+            attempts = attempts.filter(quiz__in=options['quizzes'])
+        if not options['all']:
+            attempts = attempts.filter(correct_count__isnull=True)
+
+        updated = summarize_attempts(attempts, chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Successfully stored result summaries for {updated} attempts'))
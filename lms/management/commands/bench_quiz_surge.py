@@ -0,0 +1,141 @@
+import math
+import random
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from lms.models import Course, Enrollment, Question, Quiz, QuizAttempt, StudentProfile, User
+
+STEPS = ('quiz_take', 'quiz_attempt GET', 'quiz_attempt POST', 'quiz_result')
+WRITE_PREFIXES = ('INSERT', 'UPDATE', 'DELETE')
+
+def _percentile(values, percent):
+    ordered = sorted(values)
+    return ordered[max(math.ceil(percent / 100 * len(ordered)) - 1, 0)]
+
+class Command(BaseCommand):
+    help = 'Benchmark the quiz take/attempt/result flow for many concurrent students against a seeded quiz'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=200, help='Number of simulated students')
+        parser.add_argument('--questions', type=int, default=50, help='Questions in the seeded quiz')
+        parser.add_argument('--concurrency', type=int, default=10, help='Students running the flow at once')
+        parser.add_argument('--host', default='localhost', help='Host header sent with each request')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed for the submitted answers')
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded course, quiz and students')
+
+    def handle(self, *args, **options):
+        self.host = options['host']
+        self.random = random.Random(options['seed'])
+        course, quiz, students = self._seed(options['students'], options['questions'])
+        self.stdout.write(
+            f'Seeded quiz {quiz.pk} with {options["questions"]} questions for {len(students)} students'
+        )
+
+        try:
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+                results = list(pool.map(lambda student: self._run_flow(student, quiz), students))
+            elapsed = time.perf_counter() - started
+            self._report(results, elapsed)
+        finally:
+            if not options['keep']:
+                instructor = course.instructor
+                course.delete()
+                User.objects.filter(pk__in=[student.pk for student in students]).delete()
+                instructor.delete()
+
+    def _seed(self, student_count, question_count):
+        tag = uuid.uuid4().hex[:8]
+        instructor = User.objects.create(username=f'bench_{tag}_instructor', role='instructor')
+        course = Course.objects.create(
+            title=f'Benchmark course {tag}', description='Quiz surge benchmark', instructor=instructor
+        )
+        quiz = Quiz.objects.create(
+            course=course, title='Benchmark quiz', description='Quiz surge benchmark', max_marks=question_count
+        )
+        Question.objects.bulk_create([
+            Question(
+                quiz=quiz, question_text=f'Question {order}', option_a='A', option_b='B', option_c='C',
+                option_d='D', correct_answer=self.random.choice('ABCD'), marks=1, order=order
+            )
+            for order in range(question_count)
+        ])
+
+        # bulk_create skips the post_save receivers, so profiles and counters are seeded set-based
+        User.objects.bulk_create([
+            User(username=f'bench_{tag}_student_{number}', role='student') for number in range(student_count)
+        ])
+        students = list(User.objects.filter(username__startswith=f'bench_{tag}_student_'))
+        StudentProfile.objects.bulk_create([StudentProfile(user=student) for student in students])
+        Enrollment.objects.bulk_create([Enrollment(student=student, course=course) for student in students])
+        enrollments = Enrollment.objects.filter(course=course)
+        Enrollment.reconcile_counters(enrollments)
+        StudentProfile.reconcile_stats(StudentProfile.objects.filter(user__in=students))
+        return course, quiz, students
+
+    def _request(self, client, timings, step, method, url, data=None):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = getattr(client, method)(url, data)
+            elapsed = time.perf_counter() - started
+        writes = sum(1 for query in queries.captured_queries if query['sql'].lstrip().upper().startswith(WRITE_PREFIXES))
+        timings[step].append((elapsed, len(queries.captured_queries), writes))
+        return response
+
+    def _run_flow(self, student, quiz):
+        timings = defaultdict(list)
+        client = Client(HTTP_HOST=self.host)
+        client.force_login(student)
+        connection.ensure_connection()
+        try:
+            response = self._request(client, timings, 'quiz_take', 'get', reverse('quiz_take', args=[quiz.pk]))
+            attempt_id = QuizAttempt.objects.filter(quiz=quiz, student=student).values_list('pk', flat=True).first()
+            if response.status_code != 302 or attempt_id is None:
+                raise RuntimeError(f'quiz_take failed for {student.username}: HTTP {response.status_code}')
+
+            attempt_url = reverse('quiz_attempt', args=[attempt_id])
+            self._request(client, timings, 'quiz_attempt GET', 'get', attempt_url)
+            answers = {
+                f'question_{question_id}': self.random.choice('ABCD')
+                for question_id in Question.objects.filter(quiz=quiz).values_list('pk', flat=True)
+            }
+            self._request(client, timings, 'quiz_attempt POST', 'post', attempt_url, answers)
+            self._request(client, timings, 'quiz_result', 'get', reverse('quiz_result', args=[attempt_id]))
+        finally:
+            connections.close_all()
+        return timings
+
+    def _report(self, results, elapsed):
+        merged = defaultdict(list)
+        for timings in results:
+            for step, samples in timings.items():
+                merged[step].extend(samples)
+
+        self.stdout.write(f'{"step":<20}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}{"queries":>10}{"writes":>10}')
+        for step in STEPS:
+            samples = merged[step]
+            if not samples:
+                continue
+            latencies = [sample[0] * 1000 for sample in samples]
+            queries = sum(sample[1] for sample in samples) / len(samples)
+            writes = sum(sample[2] for sample in samples) / len(samples)
+            self.stdout.write(
+                f'{step:<20}{_percentile(latencies, 50):>10.1f}{_percentile(latencies, 95):>10.1f}'
+                f'{_percentile(latencies, 99):>10.1f}{queries:>10.1f}{writes:>10.1f}'
+            )
+
+        submissions = len(merged['quiz_attempt POST'])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Completed {submissions} submissions in {elapsed:.2f}s ({submissions / max(elapsed, 1e-6):,.1f}/sec); '
+                f'DB writes per submission: {sum(sample[2] for sample in merged["quiz_attempt POST"]) / max(submissions, 1):.1f}'
+            )
+        )
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+from lms.grading import EXPIRY_BATCH_SIZE, expire_attempts
+
+class Command(BaseCommand):
+    help = 'Finalize open quiz attempts past their deadline, grading their autosaved answers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=EXPIRY_BATCH_SIZE, help='Attempts finalized per transaction')
+        parser.add_argument('--sleep', type=float, default=30.0, help='Seconds to wait when nothing has expired')
+        parser.add_argument('--once', action='store_true', help='Exit once no expired attempts are left')
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            expired = expire_attempts(options['batch_size'])
+            total += expired
+            if expired:
+                self.stdout.write(f'Finalized {expired} expired attempts')
+                continue
+            if options['once']:
+                break
+            time.sleep(options['sleep'])
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Successfully finalized {total} expired attempts'
+            )
+        )
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+from lms.progress import process_queue
+
+class Command(BaseCommand):
+    help = 'Drain the progress queue, recomputing progress and badges for dirty (student, course) keys'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Keys drained per transaction')
+        parser.add_argument('--sleep', type=float, default=2.0, help='Seconds to wait when the queue is empty')
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is empty')
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            processed = process_queue(options['batch_size'])
+            total += processed
+            if processed:
+                self.stdout.write(f'Recomputed {processed} keys')
+                continue
+            if options['once']:
+                break
+            time.sleep(options['sleep'])
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Successfully processed {total} queued keys'
+            )
+        )
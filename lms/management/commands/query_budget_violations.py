@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from lms.query_budget import budget_for, load_budgets, violation_counts
+
+class Command(BaseCommand):
+    help = 'Print how many sampled live requests to each budgeted view ran over its query budget'
+
+    def handle(self, *args, **options):
+        counts = violation_counts()
+        self.stdout.write(f'{"view":<24}{"budget":<28}{"violations":>10}')
+        for url_name, budget in sorted(load_budgets().items()):
+            if isinstance(budget, dict):
+                budget = ', '.join(f'{role} {budget_for(url_name, role)}' for role in budget)
+            count = counts.get(url_name, 0)
+            line = f'{url_name:<24}{budget:<28}{count:>10}'
+            self.stdout.write(self.style.WARNING(line) if count else line)
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from lms.models import InstructorProfile, StudentProfile
+
+class Command(BaseCommand):
+    help = 'Recount student and instructor profile statistics to repair any drift in the maintained counters'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Profiles recounted per UPDATE')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        for model in (StudentProfile, InstructorProfile):
+            pks = list(model.objects.order_by('pk').values_list('pk', flat=True))
+            updated = 0
+            for start in range(0, len(pks), chunk_size):
+                updated += model.reconcile_stats(model.objects.filter(pk__in=pks[start:start + chunk_size]))
+            self.stdout.write(f'{model.__name__}: {updated} profiles recounted')
+
+        self.stdout.write(self.style.SUCCESS('Successfully reconciled profile statistics'))
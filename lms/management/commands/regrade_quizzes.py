@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+from lms.grading import process_regrades, regrade_quiz
+
+class Command(BaseCommand):
+    help = 'Regrade quizzes whose questions changed, rescoring attempts and re-running progress and badges'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--quiz', type=int, action='append', dest='quizzes',
+                            help='Quiz id to regrade now even if not flagged (repeatable)')
+        parser.add_argument('--batch-size', type=int, default=10, help='Flagged quizzes regraded per pass')
+        parser.add_argument('--sleep', type=float, default=10.0, help='Seconds to wait when nothing is flagged')
+        parser.add_argument('--once', action='store_true', help='Exit once no quiz is flagged')
+
+    def handle(self, *args, **options):
+        if options['quizzes']:
+            for quiz_id in options['quizzes']:
+                changed = regrade_quiz(quiz_id)
+                self.stdout.write(f'Quiz {quiz_id}: {changed} attempts changed')
+            return
+
+        total = 0
+        while True:
+            processed = process_regrades(options['batch_size'])
+            total += processed
+            if processed:
+                self.stdout.write(f'Regraded {processed} quizzes')
+                continue
+            if options['once']:
+                break
+            time.sleep(options['sleep'])
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Successfully regraded {total} quizzes'
+            )
+        )
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+from lms.models import Lesson
+from lms.outline import invalidate_outline
+from lms.rendering import render_lesson_content
+
+class Command(BaseCommand):
+    help = 'Re-render the stored HTML body of every lesson from its content'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Lessons re-rendered per UPDATE')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        batch = []
+        updated = 0
+        course_ids = set()
+        lessons = Lesson.objects.only('pk', 'content', 'content_html').annotate(course_id=F('module__course_id'))
+        for lesson in lessons.order_by('pk').iterator(chunk_size=batch_size):
+            html = render_lesson_content(lesson.content)
+            if html != lesson.content_html:
+                lesson.content_html = html
+                batch.append(lesson)
+                course_ids.add(lesson.course_id)
+            if len(batch) == batch_size:
+                updated += Lesson.objects.bulk_update(batch, ['content_html'])
+                batch = []
+        updated += Lesson.objects.bulk_update(batch, ['content_html'])
+
+        # bulk_update skips the Lesson receivers, so move the page validators here
+        for course_id in course_ids:
+            invalidate_outline(course_id)
+
+        self.stdout.write(self.style.SUCCESS(f'Re-rendered {updated} lessons'))
@@ -0,0 +1,68 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:12
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_item_counters(apps, schema_editor):
+    """Seed the new counters from the existing assignments, submissions, quizzes and attempts"""
+    Enrollment = apps.get_model('lms', 'Enrollment')
+    Assignment = apps.get_model('lms', 'Assignment')
+    AssignmentSubmission = apps.get_model('lms', 'AssignmentSubmission')
+    Quiz = apps.get_model('lms', 'Quiz')
+    QuizAttempt = apps.get_model('lms', 'QuizAttempt')
+
+    def count_subquery(qs, group_by, field='pk', distinct=False):
+        return Coalesce(
+            Subquery(qs.order_by().values(group_by).annotate(c=Count(field, distinct=distinct)).values('c')[:1]),
+            0,
+        )
+
+    Enrollment.objects.update(
+        total_items=(
+            count_subquery(Assignment.objects.filter(course=OuterRef('course')), 'course')
+            + count_subquery(Quiz.objects.filter(course=OuterRef('course')), 'course')
+        ),
+        completed_items=(
+            count_subquery(
+                AssignmentSubmission.objects.filter(
+                    student=OuterRef('student'),
+                    assignment__course=OuterRef('course'),
+                    marks__isnull=False,
+                ),
+                'student',
+            )
+            + count_subquery(
+                QuizAttempt.objects.filter(
+                    student=OuterRef('student'),
+                    quiz__course=OuterRef('course'),
+                    is_completed=True,
+                ),
+                'student',
+                field='quiz',
+                distinct=True,
+            )
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0003_alter_assignment_due_date'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='enrollment',
+            name='completed_items',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='enrollment',
+            name='total_items',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_item_counters, migrations.RunPython.noop),
+    ]
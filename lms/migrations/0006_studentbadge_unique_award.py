@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:15
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicate_awards(apps, schema_editor):
+    """Keep the earliest award of each (student, badge, course) before adding the constraint"""
+    StudentBadge = apps.get_model('lms', 'StudentBadge')
+    duplicates = (
+        StudentBadge.objects.order_by()
+        .values('student', 'badge', 'course')
+        .annotate(first_id=Min('id'), awards=Count('id'))
+        .filter(awards__gt=1)
+    )
+    for row in duplicates:
+        StudentBadge.objects.filter(
+            student=row['student'],
+            badge=row['badge'],
+            course=row['course'],
+        ).exclude(id=row['first_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0005_pendingprogressupdate'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_awards, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='studentbadge',
+            constraint=models.UniqueConstraint(fields=('student', 'badge', 'course'), name='unique_student_badge_per_course'),
+        ),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:19
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+
+def backfill_completed_at(apps, schema_editor):
+    """Stamp enrollments already at 100% (the original completion time is unknown)"""
+    Enrollment = apps.get_model('lms', 'Enrollment')
+    Enrollment.objects.filter(progress__gte=100).update(completed_at=timezone.now())
+
+
+def _count(queryset, group_by, field='pk', distinct=False):
+    return Coalesce(
+        Subquery(queryset.order_by().values(group_by).annotate(c=Count(field, distinct=distinct)).values('c')[:1]),
+        0,
+    )
+
+
+def reconcile_profile_stats(apps, schema_editor):
+    """Recount profile statistics once; from here on they are only incremented and decremented"""
+    Enrollment = apps.get_model('lms', 'Enrollment')
+    Course = apps.get_model('lms', 'Course')
+    ModuleProgress = apps.get_model('lms', 'ModuleProgress')
+    StudentBadge = apps.get_model('lms', 'StudentBadge')
+    StudentProfile = apps.get_model('lms', 'StudentProfile')
+    InstructorProfile = apps.get_model('lms', 'InstructorProfile')
+    now = timezone.now()
+    StudentProfile.objects.update(
+        total_courses_enrolled=_count(Enrollment.objects.filter(student=OuterRef('user')), 'student'),
+        total_courses_completed=_count(
+            Enrollment.objects.filter(student=OuterRef('user'), completed_at__isnull=False), 'student'
+        ),
+        total_modules_completed=_count(
+            ModuleProgress.objects.filter(student=OuterRef('user'), is_completed=True), 'student'
+        ),
+        total_badges_earned=_count(StudentBadge.objects.filter(student=OuterRef('user')), 'student'),
+        updated_at=now,
+    )
+    InstructorProfile.objects.update(
+        total_courses_created=_count(Course.objects.filter(instructor=OuterRef('user')), 'instructor'),
+        total_students=_count(
+            Enrollment.objects.filter(course__instructor=OuterRef('user')),
+            'course__instructor',
+            field='student',
+            distinct=True
+        ),
+        total_badges_awarded=_count(
+            StudentBadge.objects.filter(awarded_by=OuterRef('user'), is_instructor_awarded=True), 'awarded_by'
+        ),
+        updated_at=now,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0006_studentbadge_unique_award'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='enrollment',
+            name='completed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_completed_at, migrations.RunPython.noop),
+        migrations.RunPython(reconcile_profile_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0007_enrollment_completed_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quiz',
+            name='regrade_requested_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0008_quiz_regrade_requested_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='quizattempt',
+            index=models.Index(fields=['quiz', '-id'], name='quizattempt_quiz_id_desc'),
+        ),
+        migrations.AddIndex(
+            model_name='quizattempt',
+            index=models.Index(fields=['quiz', 'is_completed', 'score'], name='quizattempt_quiz_score'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:29
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicate_open_attempts(apps, schema_editor):
+    """Keep the earliest open attempt of each (quiz, student) before adding the constraint"""
+    QuizAttempt = apps.get_model('lms', 'QuizAttempt')
+    duplicates = (
+        QuizAttempt.objects.filter(is_completed=False)
+        .order_by()
+        .values('quiz', 'student')
+        .annotate(first_id=Min('id'), attempts=Count('id'))
+        .filter(attempts__gt=1)
+    )
+    for row in duplicates:
+        QuizAttempt.objects.filter(
+            quiz=row['quiz'],
+            student=row['student'],
+            is_completed=False,
+        ).exclude(id=row['first_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0009_quizattempt_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_open_attempts, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='quizattempt',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_completed', False)), fields=('quiz', 'student'), name='unique_open_quiz_attempt'),
+        ),
+    ]
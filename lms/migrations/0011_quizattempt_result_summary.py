@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0010_quizattempt_unique_open'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quizattempt',
+            name='correct_count',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='quizattempt',
+            name='passed',
+            field=models.BooleanField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='quizattempt',
+            name='percentage',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='quizattempt',
+            name='result_bitmap',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='quizattempt',
+            name='total_marks',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:32
+
+from datetime import timedelta
+
+from django.db import migrations, models
+
+
+def backfill_open_deadlines(apps, schema_editor):
+    """Give open attempts the deadline their quiz's time limit implies, so abandoned ones get swept"""
+    Quiz = apps.get_model('lms', 'Quiz')
+    QuizAttempt = apps.get_model('lms', 'QuizAttempt')
+    for quiz_id, duration in Quiz.objects.filter(attempts__is_completed=False).distinct().values_list('id', 'duration_minutes'):
+        QuizAttempt.objects.filter(quiz=quiz_id, is_completed=False, deadline_at__isnull=True).update(
+            deadline_at=models.F('started_at') + timedelta(minutes=duration)
+        )
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0011_quizattempt_result_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quizattempt',
+            name='deadline_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_open_deadlines, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='quizattempt',
+            index=models.Index(condition=models.Q(('is_completed', False)), fields=['deadline_at'], name='quizattempt_open_deadline'),
+        ),
+    ]
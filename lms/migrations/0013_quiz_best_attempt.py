@@ -0,0 +1,65 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:35
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_best_attempts(apps, schema_editor):
+    """Materialize each student's best completed attempt at every quiz"""
+    QuizAttempt = apps.get_model('lms', 'QuizAttempt')
+    QuizBestAttempt = apps.get_model('lms', 'QuizBestAttempt')
+    best = {}
+    attempts = QuizAttempt.objects.filter(is_completed=True).order_by(F('score').desc(nulls_last=True), 'pk')
+    for pk, student_id, quiz_id, score, percentage, passed in attempts.values_list(
+        'pk', 'student_id', 'quiz_id', 'score', 'percentage', 'passed'
+    ).iterator():
+        row = best.get((student_id, quiz_id))
+        if row is None:
+            best[(student_id, quiz_id)] = QuizBestAttempt(
+                student_id=student_id,
+                quiz_id=quiz_id,
+                attempt_id=pk,
+                score=score or 0,
+                percentage=percentage,
+                passed=passed,
+                attempt_count=1
+            )
+        else:
+            row.attempt_count += 1
+    QuizBestAttempt.objects.bulk_create(best.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0012_quizattempt_deadline'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quiz',
+            name='max_attempts',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.CreateModel(
+            name='QuizBestAttempt',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.IntegerField(default=0)),
+                ('percentage', models.FloatField(blank=True, null=True)),
+                ('passed', models.BooleanField(blank=True, null=True)),
+                ('attempt_count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('attempt', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='lms.quizattempt')),
+                ('quiz', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='best_attempts', to='lms.quiz')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='quiz_best_attempts', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['quiz', 'score'], name='quizbest_quiz_score')],
+                'constraints': [models.UniqueConstraint(fields=('student', 'quiz'), name='unique_quiz_best_attempt')],
+            },
+        ),
+        migrations.RunPython(backfill_best_attempts, migrations.RunPython.noop),
+    ]
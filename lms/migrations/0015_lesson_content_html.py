@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:10
+
+from django.db import migrations, models
+
+from lms.rendering import render_lesson_content
+
+
+def render_existing_lessons(apps, schema_editor):
+    """Store the rendered body of every existing lesson"""
+    Lesson = apps.get_model('lms', 'Lesson')
+    batch = []
+    for lesson in Lesson.objects.only('pk', 'content').order_by('pk').iterator(chunk_size=500):
+        lesson.content_html = render_lesson_content(lesson.content)
+        batch.append(lesson)
+        if len(batch) == 500:
+            Lesson.objects.bulk_update(batch, ['content_html'])
+            batch = []
+    Lesson.objects.bulk_update(batch, ['content_html'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lms', '0014_course_catalog_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lesson',
+            name='content_html',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunPython(render_existing_lessons, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,33 @@
-from django.db import models
+from collections import Counter, defaultdict
+
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, Count, F, FloatField, IntegerField, OuterRef, Subquery, Value, When
+from django.db.models.functions import Cast, Coalesce, Round
+from django.db.models.lookups import GreaterThan
 from django.contrib.auth.models import AbstractUser
 from django.utils import timezone
 
+from .rendering import render_lesson_content
+
+def _count_subquery(queryset, group_by, field='pk', distinct=False):
+    """Correlated COUNT subquery (0 when no rows match) for use in annotations and updates"""
+    return Coalesce(
+        Subquery(
+            queryset.order_by().values(group_by)
+            .annotate(c=Count(field, distinct=distinct))
+            .values('c')[:1]
+        ),
+        0,
+    )
+
+def _add_counts(model, field, user_ids, sign=1):
+    """Add to field the number of times each user appears in user_ids (one UPDATE per distinct count)"""
+    users_by_count = defaultdict(list)
+    for user_id, count in Counter(user_ids).items():
+        users_by_count[count].append(user_id)
+    for count, users in users_by_count.items():
+        model.objects.filter(user__in=users).update(**{field: F(field) + sign * count})
+
 class User(AbstractUser):
     ROLE_CHOICES = (
         ('student', 'Student'),
@@ -23,6 +49,12 @@ class Course(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     is_published = models.BooleanField(default=False)
     
+    class Meta:
+        indexes = [
+            # Keyset pagination of the published catalog, newest first
+            models.Index(fields=['is_published', '-id'], name='course_published_id_desc'),
+        ]
+    
     def __str__(self):
         return self.title
 
@@ -31,6 +63,9 @@ class Enrollment(models.Model):
     course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='enrollments')
     enrolled_at = models.DateTimeField(auto_now_add=True)
     progress = models.FloatField(default=0.0)
+    completed_items = models.IntegerField(default=0)
+    total_items = models.IntegerField(default=0)
+    completed_at = models.DateTimeField(null=True, blank=True)
     
     class Meta:
         unique_together = ('student', 'course')
@@ -38,61 +73,95 @@ class Enrollment(models.Model):
     def __str__(self):
         return f"{self.student.username} - {self.course.title}"
     
-    def update_progress(self):
-        """Calculate and update course progress based on completed items (assignments and quizzes only)"""
-        course = self.course
-        student = self.student
-        
-        total_items = 0
-        completed_items = 0
-        
-        # Count assignments
-        assignments = course.assignments.all()
-        total_items += assignments.count()
-        completed_items += AssignmentSubmission.objects.filter(
-            student=student,
-            assignment__in=assignments
-        ).exclude(marks__isnull=True).count()
-        
-        # Count quizzes
-        quizzes = course.quizzes.all()
-        total_items += quizzes.count()
-        completed_items += QuizAttempt.objects.filter(
-            student=student,
-            quiz__in=quizzes,
-            is_completed=True
-        ).count()
+    @staticmethod
+    def progress_expression(completed, total):
+        """SQL expression computing the progress percentage from item counter expressions"""
+        return Case(
+            When(GreaterThan(total, 0), then=Round(Cast(completed, FloatField()) * 100 / total, 2)),
+            default=Value(0.0),
+            output_field=FloatField(),
+        )
+    
+    @classmethod
+    def apply_progress_delta(cls, queryset, completed=0, total=0):
+        """Atomically shift the item counters (and progress) of every enrollment in the queryset"""
+        completed_items = F('completed_items') + completed
+        total_items = F('total_items') + total
+        return queryset.update(
+            completed_items=completed_items,
+            total_items=total_items,
+            progress=cls.progress_expression(completed_items, total_items),
+        )
+    
+    @classmethod
+    def record_item_completion(cls, student, course, delta=1):
+        """Apply a completed-item delta for one student's enrollment in a course"""
+        enrollments = cls.objects.filter(student=student, course=course)
+        updated = cls.apply_progress_delta(enrollments, completed=delta)
+        cls.sync_completion(enrollments, gained=delta > 0, lost=delta < 0)
+        return updated
+    
+    @classmethod
+    def sync_completion(cls, queryset, gained=True, lost=True):
+        """Flag enrollments that crossed 100% in either direction and shift the students' completed-course counters"""
+        if gained:
+            newly_completed = queryset.filter(progress__gte=100, completed_at__isnull=True)
+            students = list(newly_completed.values_list('student_id', flat=True))
+            if students:
+                newly_completed.update(completed_at=timezone.now())
+                StudentProfile.add_counts('total_courses_completed', students)
+        if lost:
+            reopened = queryset.filter(progress__lt=100, completed_at__isnull=False)
+            students = list(reopened.values_list('student_id', flat=True))
+            if students:
+                reopened.update(completed_at=None)
+                StudentProfile.add_counts('total_courses_completed', students, sign=-1)
+    
+    @classmethod
+    def reconcile_counters(cls, queryset=None):
+        """Recount completed/total items with set-based UPDATEs, repairing any drifted counters"""
+        if queryset is None:
+            queryset = cls.objects.all()
         
-        # Calculate progress
-        if total_items > 0:
-            self.progress = round((completed_items / total_items) * 100, 2)
-        else:
-            self.progress = 0
+        total_assignments = _count_subquery(Assignment.objects.filter(course=OuterRef('course')), 'course')
+        total_quizzes = _count_subquery(Quiz.objects.filter(course=OuterRef('course')), 'course')
+        graded_submissions = _count_subquery(
+            AssignmentSubmission.objects.filter(
+                student=OuterRef('student'),
+                assignment__course=OuterRef('course'),
+                marks__isnull=False
+            ),
+            'student'
+        )
+        # One best-attempt row per completed quiz, however many attempts were made
+        completed_quizzes = _count_subquery(
+            QuizBestAttempt.objects.filter(
+                student=OuterRef('student'),
+                quiz__course=OuterRef('course')
+            ),
+            'student'
+        )
         
-        self.save()
+        updated = queryset.update(
+            total_items=total_assignments + total_quizzes,
+            completed_items=graded_submissions + completed_quizzes,
+        )
+        queryset.update(progress=cls.progress_expression(F('completed_items'), F('total_items')))
+        cls.sync_completion(queryset)
+        return updated
+    
+    def update_progress(self):
+        """Recount this enrollment's completed items (assignments and quizzes only)"""
+        enrollments = Enrollment.objects.filter(pk=self.pk)
+        Enrollment.reconcile_counters(enrollments)
+        self.refresh_from_db(fields=['completed_items', 'total_items', 'progress', 'completed_at'])
         
         # Auto-award course completion badge if 100%
         if self.progress == 100:
-            self._award_course_completion_badge()
+            from .badges import award_badges
+            award_badges('course_completed', self, self.student_id, self.course_id)
         
         return self.progress
-    
-    def _award_course_completion_badge(self):
-        """Award course completion badge"""
-        badge, _ = Badge.objects.get_or_create(
-            badge_type='course_complete',
-            defaults={
-                'name': 'Course Completion',
-                'description': 'Completed all assignments and quizzes',
-                'icon': '🎓'
-            }
-        )
-        StudentBadge.objects.get_or_create(
-            student=self.student,
-            badge=badge,
-            course=self.course,
-            defaults={'is_instructor_awarded': False}
-        )
 
 class Module(models.Model):
     course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='modules')
@@ -111,6 +180,8 @@ class Lesson(models.Model):
     module = models.ForeignKey(Module, on_delete=models.CASCADE, related_name='lessons')
     title = models.CharField(max_length=200)
     content = models.TextField()
+    # Rendered from content on save; served as-is by the lesson page
+    content_html = models.TextField(blank=True, default='', editable=False)
     video_url = models.URLField(blank=True, null=True)
     order = models.IntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -120,6 +191,14 @@ class Lesson(models.Model):
     
     def __str__(self):
         return f"{self.module.title} - {self.title}"
+    
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'content' in update_fields:
+            self.content_html = render_lesson_content(self.content)
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'content_html'}
+        super().save(*args, **kwargs)
 
 class Assignment(models.Model):
     course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='assignments')
@@ -148,6 +227,19 @@ class AssignmentSubmission(models.Model):
     
     def __str__(self):
         return f"{self.student.username} - {self.assignment.title}"
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored graded state so saves only count real transitions
+        loaded = dict(zip(field_names, values))
+        instance._was_graded = loaded['marks'] is not None if 'marks' in loaded else None
+        return instance
+    
+    @property
+    def was_graded(self):
+        """Graded state as last loaded/saved; None when unknown (deferred field)"""
+        return getattr(self, '_was_graded', False)
 
 class Quiz(models.Model):
     course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='quizzes')
@@ -156,7 +248,9 @@ class Quiz(models.Model):
     duration_minutes = models.IntegerField(default=30)
     max_marks = models.IntegerField(default=100)
     pass_marks = models.IntegerField(default=40)
+    max_attempts = models.PositiveIntegerField(default=1)
     created_at = models.DateTimeField(auto_now_add=True)
+    regrade_requested_at = models.DateTimeField(null=True, blank=True, db_index=True)
     
     def __str__(self):
         return f"{self.course.title} - {self.title}"
@@ -177,17 +271,183 @@ class Question(models.Model):
     
     def __str__(self):
         return f"{self.quiz.title} - Q{self.order}"
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored grading fields so saves only trigger a regrade when they change
+        loaded = dict(zip(field_names, values))
+        instance._graded_as = (loaded.get('correct_answer'), loaded.get('marks'))
+        return instance
 
 class QuizAttempt(models.Model):
     quiz = models.ForeignKey(Quiz, on_delete=models.CASCADE, related_name='attempts')
     student = models.ForeignKey(User, on_delete=models.CASCADE, related_name='quiz_attempts')
     started_at = models.DateTimeField(auto_now_add=True)
     submitted_at = models.DateTimeField(null=True, blank=True)
+    # When the quiz's time limit runs out; expired open attempts are finalized by expire_quiz_attempts
+    deadline_at = models.DateTimeField(null=True, blank=True)
     score = models.IntegerField(null=True, blank=True)
     is_completed = models.BooleanField(default=False)
+    # Result summary stored when the attempt is graded
+    correct_count = models.IntegerField(null=True, blank=True)
+    total_marks = models.IntegerField(null=True, blank=True)
+    percentage = models.FloatField(null=True, blank=True)
+    passed = models.BooleanField(null=True, blank=True)
+    # One character per question in quiz order: '1' correct, '0' incorrect, '-' unanswered
+    result_bitmap = models.TextField(blank=True, default='')
+    
+    class Meta:
+        indexes = [
+            # Keyset pagination of a quiz's attempts, newest first
+            models.Index(fields=['quiz', '-id'], name='quizattempt_quiz_id_desc'),
+            # Score aggregates, histogram and median over completed attempts
+            models.Index(fields=['quiz', 'is_completed', 'score'], name='quizattempt_quiz_score'),
+            # Expiry sweep over the (small) set of open attempts
+            models.Index(
+                fields=['deadline_at'],
+                condition=models.Q(is_completed=False),
+                name='quizattempt_open_deadline'
+            ),
+        ]
+        constraints = [
+            # At most one attempt in progress per student and quiz
+            models.UniqueConstraint(
+                fields=['quiz', 'student'],
+                condition=models.Q(is_completed=False),
+                name='unique_open_quiz_attempt'
+            ),
+        ]
     
     def __str__(self):
         return f"{self.student.username} - {self.quiz.title} - Attempt"
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored completion state so saves only count real transitions
+        loaded = dict(zip(field_names, values))
+        instance._was_completed = loaded['is_completed'] if 'is_completed' in loaded else None
+        return instance
+    
+    @property
+    def was_completed(self):
+        """Completion state as last loaded/saved; None when unknown (deferred field)"""
+        return getattr(self, '_was_completed', False)
+
+class QuizBestAttempt(models.Model):
+    """A student's best completed attempt at a quiz, maintained as attempts complete"""
+    student = models.ForeignKey(User, on_delete=models.CASCADE, related_name='quiz_best_attempts')
+    quiz = models.ForeignKey(Quiz, on_delete=models.CASCADE, related_name='best_attempts')
+    attempt = models.ForeignKey(QuizAttempt, on_delete=models.CASCADE, related_name='+')
+    score = models.IntegerField(default=0)
+    percentage = models.FloatField(null=True, blank=True)
+    passed = models.BooleanField(null=True, blank=True)
+    attempt_count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    BEST_FIELDS = ('attempt', 'score', 'percentage', 'passed')
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['student', 'quiz'], name='unique_quiz_best_attempt'),
+        ]
+        indexes = [
+            # Gradebook aggregates over a quiz's best scores
+            models.Index(fields=['quiz', 'score'], name='quizbest_quiz_score'),
+        ]
+    
+    def __str__(self):
+        return f"{self.student.username} - {self.quiz.title} - Best"
+    
+    @classmethod
+    def record(cls, attempt):
+        """
+        Fold a newly completed attempt into its student's best row for the quiz.
+        
+        One UPDATE counts the attempt and takes over the best fields only if it
+        scores higher (ties keep the earlier attempt), so concurrent completions
+        cannot lose each other. Returns True when this was the student's first
+        completed attempt at the quiz and the row was created.
+        """
+        score = attempt.score or 0
+        values = {'attempt': attempt.pk, 'score': score, 'percentage': attempt.percentage, 'passed': attempt.passed}
+        output_fields = {'attempt': IntegerField(), 'score': IntegerField(), 'percentage': FloatField(), 'passed': models.BooleanField()}
+        changes = {'attempt_count': F('attempt_count') + 1, 'updated_at': timezone.now()}
+        for field in cls.BEST_FIELDS:
+            changes[field] = Case(
+                When(score__lt=score, then=Value(values[field])),
+                default=F(field),
+                output_field=output_fields[field]
+            )
+        rows = cls.objects.filter(student=attempt.student_id, quiz=attempt.quiz_id)
+        if rows.update(**changes):
+            return False
+        try:
+            with transaction.atomic():
+                cls.objects.create(
+                    student_id=attempt.student_id,
+                    quiz_id=attempt.quiz_id,
+                    attempt_id=attempt.pk,
+                    score=score,
+                    percentage=attempt.percentage,
+                    passed=attempt.passed,
+                    attempt_count=1
+                )
+            return True
+        except IntegrityError:
+            # Another completion created the row first
+            rows.update(**changes)
+            return False
+    
+    @classmethod
+    def refresh(cls, pairs):
+        """Rebuild the best rows of the given (student_id, quiz_id) pairs from their completed attempts"""
+        pairs = set(pairs)
+        if not pairs:
+            return 0
+        students = {student_id for student_id, _ in pairs}
+        quizzes = {quiz_id for _, quiz_id in pairs}
+        
+        best = {}
+        counts = Counter()
+        for pk, student_id, quiz_id, score, percentage, passed in QuizAttempt.objects.filter(
+            student__in=students,
+            quiz__in=quizzes,
+            is_completed=True
+        ).order_by(F('score').desc(nulls_last=True), 'pk').values_list(
+            'pk', 'student_id', 'quiz_id', 'score', 'percentage', 'passed'
+        ):
+            key = (student_id, quiz_id)
+            if key not in pairs:
+                continue
+            counts[key] += 1
+            if key not in best:
+                best[key] = cls(
+                    student_id=student_id,
+                    quiz_id=quiz_id,
+                    attempt_id=pk,
+                    score=score or 0,
+                    percentage=percentage,
+                    passed=passed
+                )
+        for key, row in best.items():
+            row.attempt_count = counts[key]
+        
+        cls.objects.bulk_create(
+            best.values(),
+            update_conflicts=True,
+            unique_fields=['student', 'quiz'],
+            update_fields=[*cls.BEST_FIELDS, 'attempt_count', 'updated_at']
+        )
+        stale = [
+            pk for pk, student_id, quiz_id in cls.objects.filter(student__in=students, quiz__in=quizzes)
+            .values_list('pk', 'student_id', 'quiz_id')
+            if (student_id, quiz_id) in pairs and (student_id, quiz_id) not in best
+        ]
+        if stale:
+            cls.objects.filter(pk__in=stale).delete()
+        return len(best)
 
 class QuizAnswer(models.Model):
     attempt = models.ForeignKey(QuizAttempt, on_delete=models.CASCADE, related_name='answers')
@@ -230,6 +490,9 @@ class StudentBadge(models.Model):
     
     class Meta:
         ordering = ['-awarded_at']
+        constraints = [
+            models.UniqueConstraint(fields=['student', 'badge', 'course'], name='unique_student_badge_per_course'),
+        ]
     
     def __str__(self):
         return f"{self.student.username} - {self.badge.name}"
@@ -251,10 +514,32 @@ class StudentProfile(models.Model):
     def update_stats(self):
         """Update profile statistics"""
         self.total_courses_enrolled = Enrollment.objects.filter(student=self.user).count()
-        self.total_courses_completed = Enrollment.objects.filter(student=self.user, progress=100).count()
+        self.total_courses_completed = Enrollment.objects.filter(student=self.user, completed_at__isnull=False).count()
         self.total_modules_completed = ModuleProgress.objects.filter(student=self.user, is_completed=True).count()
         self.total_badges_earned = StudentBadge.objects.filter(student=self.user).count()
         self.save()
+    
+    @classmethod
+    def reconcile_stats(cls, queryset=None):
+        """Recount statistics for every profile in the queryset with one set-based UPDATE"""
+        if queryset is None:
+            queryset = cls.objects.all()
+        return queryset.update(
+            total_courses_enrolled=_count_subquery(Enrollment.objects.filter(student=OuterRef('user')), 'student'),
+            total_courses_completed=_count_subquery(
+                Enrollment.objects.filter(student=OuterRef('user'), completed_at__isnull=False), 'student'
+            ),
+            total_modules_completed=_count_subquery(
+                ModuleProgress.objects.filter(student=OuterRef('user'), is_completed=True), 'student'
+            ),
+            total_badges_earned=_count_subquery(StudentBadge.objects.filter(student=OuterRef('user')), 'student'),
+            updated_at=timezone.now(),
+        )
+    
+    @classmethod
+    def add_counts(cls, field, user_ids, sign=1):
+        """Atomically add each user's occurrences in user_ids to a statistics field"""
+        _add_counts(cls, field, user_ids, sign)
 
 class InstructorProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='instructor_profile')
@@ -274,6 +559,30 @@ class InstructorProfile(models.Model):
         self.total_students = Enrollment.objects.filter(course__instructor=self.user).values('student').distinct().count()
         self.total_badges_awarded = StudentBadge.objects.filter(awarded_by=self.user, is_instructor_awarded=True).count()
         self.save()
+    
+    @classmethod
+    def reconcile_stats(cls, queryset=None):
+        """Recount statistics for every profile in the queryset with one set-based UPDATE"""
+        if queryset is None:
+            queryset = cls.objects.all()
+        return queryset.update(
+            total_courses_created=_count_subquery(Course.objects.filter(instructor=OuterRef('user')), 'instructor'),
+            total_students=_count_subquery(
+                Enrollment.objects.filter(course__instructor=OuterRef('user')),
+                'course__instructor',
+                field='student',
+                distinct=True
+            ),
+            total_badges_awarded=_count_subquery(
+                StudentBadge.objects.filter(awarded_by=OuterRef('user'), is_instructor_awarded=True), 'awarded_by'
+            ),
+            updated_at=timezone.now(),
+        )
+    
+    @classmethod
+    def add_counts(cls, field, user_ids, sign=1):
+        """Atomically add each user's occurrences in user_ids to a statistics field"""
+        _add_counts(cls, field, user_ids, sign)
 
 # Progress Tracking Models
 class LessonProgress(models.Model):
@@ -291,22 +600,11 @@ class LessonProgress(models.Model):
         return f"{self.student.username} - {self.lesson.title}"
     
     def mark_complete(self):
-        """Mark lesson as completed"""
+        """Mark lesson as completed (module progress is recomputed by the progress queue)"""
         if not self.is_completed:
             self.is_completed = True
             self.completed_at = timezone.now()
             self.save()
-            # Check if module is completed
-            self.check_module_completion()
-    
-    def check_module_completion(self):
-        """Check if all lessons in module are completed"""
-        module = self.lesson.module
-        module_progress, created = ModuleProgress.objects.get_or_create(
-            student=self.student,
-            module=module
-        )
-        module_progress.update_completion()
 
 class ModuleProgress(models.Model):
     student = models.ForeignKey(User, on_delete=models.CASCADE, related_name='module_progress')
@@ -321,46 +619,18 @@ class ModuleProgress(models.Model):
     
     def __str__(self):
         return f"{self.student.username} - {self.module.title}"
+
+class PendingProgressUpdate(models.Model):
+    """A (student, course) pair whose derived progress needs recomputing by the queue worker"""
+    student = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='+')
+    queued_at = models.DateTimeField(auto_now_add=True, db_index=True)
     
-    def update_completion(self):
-        """Update module completion status"""
-        # Check lessons
-        total_lessons = self.module.lessons.count()
-        completed_lessons = LessonProgress.objects.filter(
-            student=self.student,
-            lesson__module=self.module,
-            is_completed=True
-        ).count()
-        
-        # Check quizzes (if any)
-        module_quizzes = Quiz.objects.filter(course=self.module.course)
-        completed_quizzes = QuizAttempt.objects.filter(
-            student=self.student,
-            quiz__in=module_quizzes,
-            is_completed=True
-        ).count()
-        
-        # Check assignments (if any)
-        module_assignments = Assignment.objects.filter(course=self.module.course)
-        completed_assignments = AssignmentSubmission.objects.filter(
-            student=self.student,
-            assignment__in=module_assignments
-        ).exclude(marks__isnull=True).count()
-        
-        # Calculate total requirements
-        total_requirements = total_lessons
-        completed_requirements = completed_lessons
-        
-        if total_requirements > 0:
-            self.completion_percentage = (completed_requirements / total_requirements) * 100
-        
-        # Mark as completed if all requirements met
-        if total_lessons > 0 and completed_lessons == total_lessons:
-            if not self.is_completed:
-                self.is_completed = True
-                self.completed_at = timezone.now()
-        
-        self.save()
+    class Meta:
+        unique_together = ('student', 'course')
+    
+    def __str__(self):
+        return f"Pending progress: {self.student_id} - {self.course_id}"
 
 class Discussion(models.Model):
     course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='discussions')
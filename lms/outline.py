@@ -0,0 +1,84 @@
+"""
+Cached course outlines.
+
+A course's outline (modules with their lessons, assignments and quizzes) is
+built with one prefetch pass and stored in the cache as plain data under the
+course's outline version stamp, so every student opening the course shares
+it. The Module, Lesson, Assignment and Quiz save/delete receivers bump the
+stamp. Per-student state (enrollment, completed lessons, submissions and quiz
+results) is not part of the outline; views overlay it separately.
+"""
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Prefetch
+
+from .caching import bump_version, get_version
+from .models import Assignment, Course, Lesson, Module, Quiz
+
+OUTLINE_TIMEOUT = 60 * 60 * 24
+
+def _outline_version_name(course_id):
+    return f'course_outline:{course_id}'
+
+def outline_version(course_id):
+    """Current version stamp of a course's outline"""
+    return get_version(_outline_version_name(course_id))
+
+def invalidate_outline(course_id):
+    """Move the course outline to a new version once the current transaction commits"""
+    transaction.on_commit(lambda: bump_version(_outline_version_name(course_id)))
+
+def _build_outline(course_id):
+    course = Course.objects.prefetch_related(
+        Prefetch('modules', queryset=Module.objects.order_by('order', 'pk')),
+        Prefetch('modules__lessons', queryset=Lesson.objects.order_by('order', 'pk').only('id', 'module_id', 'title', 'order')),
+        Prefetch('assignments', queryset=Assignment.objects.order_by('pk')),
+        Prefetch('quizzes', queryset=Quiz.objects.order_by('pk')),
+    ).get(pk=course_id)
+    return {
+        'modules': [
+            {
+                'id': module.pk,
+                'title': module.title,
+                'description': module.description,
+                'lessons': [{'id': lesson.pk, 'title': lesson.title} for lesson in module.lessons.all()],
+            }
+            for module in course.modules.all()
+        ],
+        'assignments': [
+            {
+                'id': assignment.pk,
+                'title': assignment.title,
+                'description': assignment.description,
+                'due_date': assignment.due_date,
+                'max_marks': assignment.max_marks,
+            }
+            for assignment in course.assignments.all()
+        ],
+        'quizzes': [
+            {
+                'id': quiz.pk,
+                'title': quiz.title,
+                'description': quiz.description,
+                'duration_minutes': quiz.duration_minutes,
+                'max_marks': quiz.max_marks,
+                'pass_marks': quiz.pass_marks,
+            }
+            for quiz in course.quizzes.all()
+        ],
+    }
+
+def course_outline(course_id):
+    """
+    The course's outline as plain data, cached per outline version.
+
+    Returns {'modules': [{'id', 'title', 'description', 'lessons': [{'id', 'title'}]}],
+    'assignments': [{'id', 'title', 'description', 'due_date', 'max_marks'}],
+    'quizzes': [{'id', 'title', 'description', 'duration_minutes', 'max_marks', 'pass_marks'}]}.
+    """
+    key = f'lms:course_outline:{course_id}:{outline_version(course_id)}'
+    outline = cache.get(key)
+    if outline is None:
+        outline = _build_outline(course_id)
+        cache.set(key, outline, OUTLINE_TIMEOUT)
+    return outline
@@ -0,0 +1,246 @@
+"""
+Set-based progress recomputation and the coalescing progress queue.
+
+Signal receivers only record dirty (student, course) keys with ``mark_dirty``;
+the ``process_progress_queue`` management command drains them in batches,
+collapses duplicates and recomputes module progress, enrollment counters and
+course completion badges with a handful of queries per course.
+
+Bulk writes can be wrapped in ``deferred_progress`` so the receivers buffer
+the affected rows instead of running their per-row cascade.
+"""
+import threading
+from collections import defaultdict
+from contextlib import ContextDecorator
+
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import F, FloatField, OuterRef, Value, prefetch_related_objects
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from .badges import award_badges_many, award_course_completion_badges
+from .dashboards import invalidate_course_dashboards, invalidate_student_dashboards
+from .models import (
+    AssignmentSubmission, Enrollment, Lesson, LessonProgress, Module, ModuleProgress,
+    PendingProgressUpdate, Quiz, QuizAttempt, QuizBestAttempt, StudentProfile, _count_subquery
+)
+
+_deferred = threading.local()
+
+class deferred_progress(ContextDecorator):
+    """
+    Suspend the per-row progress and badge cascade for bulk writes.
+
+    While active (as a ``with`` block or a decorator) the signal receivers only
+    buffer the affected (student, course) keys, saved submissions, attempts
+    and lesson progress rows, and the best attempts to rebuild after attempt
+    deletes. Leaving the outermost block schedules one consolidated recompute
+    and badge evaluation on transaction commit; the buffer is discarded if the
+    block raises.
+    """
+
+    def __enter__(self):
+        if not getattr(_deferred, 'depth', 0):
+            _deferred.keys = set()
+            _deferred.instances = {}
+            _deferred.best_attempts = set()
+            _deferred.depth = 0
+        _deferred.depth += 1
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _deferred.depth -= 1
+        if _deferred.depth:
+            return False
+        keys, instances, best_attempts = _deferred.keys, list(_deferred.instances.values()), _deferred.best_attempts
+        _deferred.keys, _deferred.instances, _deferred.best_attempts = set(), {}, set()
+        if exc_type is None and (keys or instances or best_attempts):
+            transaction.on_commit(lambda: _flush_deferred(keys, instances, best_attempts))
+        return False
+
+def is_deferred():
+    return getattr(_deferred, 'depth', 0) > 0
+
+def defer(instance):
+    """Buffer a saved row for the consolidated recompute; returns False when no deferred block is active"""
+    if not is_deferred():
+        return False
+    # Keep only the latest state of a row saved several times in the block
+    _deferred.instances[(type(instance), instance.pk)] = instance
+    return True
+
+def defer_best_attempt_refresh(student_id, quiz_id):
+    """Buffer a best-attempt rebuild for the consolidated recompute; returns False when no deferred block is active"""
+    if not is_deferred():
+        return False
+    _deferred.best_attempts.add((student_id, quiz_id))
+    return True
+
+def _flush_deferred(keys, instances, best_attempts=()):
+    """Rebuild buffered best attempts, recompute every buffered key and evaluate badges for the buffered rows in a few queries"""
+    by_model = defaultdict(list)
+    for instance in instances:
+        by_model[type(instance)].append(instance)
+    submissions = by_model[AssignmentSubmission]
+    attempts = by_model[QuizAttempt]
+    lessons = by_model[LessonProgress]
+    prefetch_related_objects(submissions, 'assignment')
+    prefetch_related_objects(attempts, 'quiz')
+    prefetch_related_objects(lessons, 'lesson__module')
+
+    keys = set(keys)
+    keys.update((submission.student_id, submission.assignment.course_id) for submission in submissions)
+    keys.update((attempt.student_id, attempt.quiz.course_id) for attempt in attempts)
+    keys.update((progress.student_id, progress.lesson.module.course_id) for progress in lessons)
+
+    with transaction.atomic():
+        if best_attempts:
+            QuizBestAttempt.refresh(best_attempts)
+            course_ids = dict(
+                Quiz.objects.filter(pk__in={quiz_id for _, quiz_id in best_attempts}).values_list('pk', 'course_id')
+            )
+            keys.update(
+                (student_id, course_ids[quiz_id]) for student_id, quiz_id in best_attempts if quiz_id in course_ids
+            )
+        recompute(keys)
+        award_badges_many('assignment_graded', [
+            (submission, submission.student_id, submission.assignment.course_id)
+            for submission in submissions if submission.marks is not None
+        ])
+        award_badges_many('quiz_completed', [
+            (attempt, attempt.student_id, attempt.quiz.course_id)
+            for attempt in attempts if attempt.is_completed
+        ])
+
+def mark_dirty(student_id, course_id):
+    """Queue a (student, course) key for recomputation; duplicates collapse on the unique key"""
+    if is_deferred():
+        _deferred.keys.add((student_id, course_id))
+        return
+    if getattr(settings, 'LMS_PROGRESS_QUEUE_EAGER', False):
+        transaction.on_commit(lambda: recompute([(student_id, course_id)]))
+        return
+    PendingProgressUpdate.objects.bulk_create(
+        [PendingProgressUpdate(student_id=student_id, course_id=course_id)],
+        ignore_conflicts=True
+    )
+
+def _insert_module_progress(modules, students):
+    """
+    Create the missing ModuleProgress row of every given student enrolled in each module's course.
+
+    One INSERT ... SELECT over the enrollment x module join; rows that already
+    exist are left alone by ON CONFLICT DO NOTHING. Returns the rows inserted.
+    """
+    pairs = Enrollment.objects.filter(student__in=students, course__modules__in=modules).annotate(
+        new_is_completed=Value(False),
+        new_completion_percentage=Value(0.0),
+    ).values_list('student_id', 'course__modules__id', 'new_is_completed', 'new_completion_percentage')
+    select_sql, params = pairs.query.sql_with_params()
+    connection = connections[router.db_for_write(ModuleProgress)]
+    table = connection.ops.quote_name(ModuleProgress._meta.db_table)
+    columns = ', '.join(
+        connection.ops.quote_name(ModuleProgress._meta.get_field(name).column)
+        for name in ('student', 'module', 'is_completed', 'completion_percentage')
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(f'INSERT INTO {table} ({columns}) {select_sql} ON CONFLICT DO NOTHING', params)
+        return cursor.rowcount
+
+def _sync_module_progress(modules, students):
+    """
+    Recompute ModuleProgress for every given student in every module of the queryset.
+
+    students is a list or queryset of student ids. Missing rows are inserted with
+    one INSERT ... SELECT, then modules whose lessons are all completed are
+    flagged and completion percentages recounted with set-based UPDATEs over
+    correlated lesson counts. Returns the number of rows written.
+    """
+    written = _insert_module_progress(modules, students)
+
+    rows = ModuleProgress.objects.filter(student__in=students, module__in=modules).annotate(
+        total=_count_subquery(Lesson.objects.filter(module=OuterRef('module')), 'module'),
+        completed=_count_subquery(
+            LessonProgress.objects.filter(
+                student=OuterRef('student'),
+                lesson__module=OuterRef('module'),
+                is_completed=True
+            ),
+            'lesson__module'
+        ),
+    ).filter(total__gt=0)
+
+    # Completion is sticky: rows are only ever flagged, never unflagged
+    newly_completed = rows.filter(is_completed=False, completed=F('total'))
+    students_completed = list(newly_completed.values_list('student_id', flat=True))
+    if students_completed:
+        written += newly_completed.update(is_completed=True, completed_at=timezone.now())
+        StudentProfile.add_counts('total_modules_completed', students_completed)
+
+    percentage = Cast(F('completed'), FloatField()) * 100 / F('total')
+    written += rows.exclude(completion_percentage=percentage).update(completion_percentage=percentage)
+    return written
+
+def sync_module_progress(course_id, students):
+    """Recompute ModuleProgress for a roster of student ids in one course; returns the number of rows written"""
+    return _sync_module_progress(Module.objects.filter(course_id=course_id), students)
+
+def student_module_progress(student_id, course_ids):
+    """
+    Recompute ModuleProgress for one student across several courses.
+
+    Returns {course_id: [(module, progress), ...]} with modules in course order,
+    using the same fixed number of queries however many courses and modules there are.
+    """
+    modules = Module.objects.filter(course__in=course_ids)
+    _sync_module_progress(modules, [student_id])
+    progress = {row.module_id: row for row in ModuleProgress.objects.filter(student=student_id, module__in=modules)}
+    by_course = {course_id: [] for course_id in course_ids}
+    for module in modules.order_by('course_id', 'order', 'pk'):
+        by_course[module.course_id].append((module, progress.get(module.pk)))
+    return by_course
+
+def recompute(keys):
+    """Recompute derived progress for an iterable of (student_id, course_id) keys"""
+    students_by_course = defaultdict(set)
+    for student_id, course_id in keys:
+        students_by_course[course_id].add(student_id)
+
+    for course_id, student_ids in students_by_course.items():
+        student_ids = sorted(student_ids)
+        sync_module_progress(course_id, student_ids)
+        enrollments = Enrollment.objects.filter(course_id=course_id, student__in=student_ids)
+        Enrollment.reconcile_counters(enrollments)
+        award_course_completion_badges(enrollments)
+        invalidate_student_dashboards(student_ids)
+    return sum(len(ids) for ids in students_by_course.values())
+
+def recompute_course(course_id):
+    """
+    Recompute enrollment progress, module progress and student profile counters for a whole course.
+
+    Every step is a set-based statement over the course's enrollments. Returns
+    the number of rows the statements wrote so callers can report throughput.
+    """
+    enrollments = Enrollment.objects.filter(course_id=course_id)
+    rows = Enrollment.reconcile_counters(enrollments)
+    rows += sync_module_progress(course_id, enrollments.values('student'))
+    rows += len(award_course_completion_badges(enrollments))
+    invalidate_course_dashboards(course_id)
+    rows += StudentProfile.reconcile_stats(StudentProfile.objects.filter(user__in=enrollments.values('student')))
+    return rows
+
+def process_queue(batch_size=500):
+    """Drain up to batch_size queued keys in one transaction; returns how many were processed"""
+    with transaction.atomic():
+        rows = list(
+            PendingProgressUpdate.objects.select_for_update(skip_locked=True)
+            .order_by('queued_at')
+            .values_list('pk', 'student_id', 'course_id')[:batch_size]
+        )
+        if not rows:
+            return 0
+        PendingProgressUpdate.objects.filter(pk__in=[pk for pk, _, _ in rows]).delete()
+        recompute((student_id, course_id) for _, student_id, course_id in rows)
+    return len(rows)
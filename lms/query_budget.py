@@ -0,0 +1,96 @@
+"""
+Per-view query budgets.
+
+``query_budgets.json`` (kept next to this module and versioned with the code)
+maps URL names to the most database queries one GET of that view may run,
+either as a single number or per user role ({"student": n, "instructor": m})
+for views that render differently by role. Lowering a budget locks in a
+performance fix.
+
+The test suite requests every budgeted view against fixtures of two sizes
+and fails when one runs over its budget. ``QueryBudgetMiddleware`` counts the
+queries of a sample of live reads (``LMS_QUERY_BUDGET_SAMPLE_RATE``) and
+logs and tallies those over budget per URL name; ``python manage.py
+query_budget_violations`` prints the tallies.
+"""
+import functools
+import json
+import logging
+import random
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+BUDGETS_FILE = Path(__file__).with_name('query_budgets.json')
+
+# Budgets are measured on reads; submissions and other writes are not checked
+BUDGETED_METHODS = ('GET', 'HEAD')
+
+logger = logging.getLogger(__name__)
+
+@functools.cache
+def load_budgets():
+    """{url_name: budget or {role: budget}} from the budgets file"""
+    with open(BUDGETS_FILE) as budgets_file:
+        return json.load(budgets_file)['budgets']
+
+def budget_for(url_name, role=None):
+    """The query budget of a view as seen by a user role, or None if it has none"""
+    budget = load_budgets().get(url_name)
+    if isinstance(budget, dict):
+        return budget.get(role)
+    return budget
+
+def _violations_key(url_name):
+    return f'lms:query_budget:violations:{url_name}'
+
+def record_violation(url_name, role, path, count, budget):
+    logger.warning(
+        'Query budget exceeded for %s (%s) at %s: %d queries, budget %d', url_name, role, path, count, budget
+    )
+    key = _violations_key(url_name)
+    cache.add(key, 0, None)
+    cache.incr(key)
+
+def violation_counts():
+    """{url_name: violations} tallied by the middleware for every budgeted view"""
+    keys = {_violations_key(url_name): url_name for url_name in load_budgets()}
+    return {keys[key]: count for key, count in cache.get_many(keys).items()}
+
+class QueryCounter:
+    """Database execute wrapper counting the queries run while it is installed"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+class QueryBudgetMiddleware:
+    """Count the queries of sampled GET and HEAD requests and record those over their view's budget"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'LMS_QUERY_BUDGET_SAMPLE_RATE', 0)
+        if not self.sample_rate:
+            raise MiddlewareNotUsed
+
+    def __call__(self, request):
+        if request.method not in BUDGETED_METHODS or random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            response = self.get_response(request)
+
+        match = request.resolver_match
+        if match is not None:
+            role = getattr(getattr(request, 'user', None), 'role', None)
+            budget = budget_for(match.url_name, role)
+            if budget is not None and counter.count > budget:
+                record_violation(match.url_name, role, request.path, counter.count, budget)
+        return response
@@ -0,0 +1,28 @@
+"""
+Lesson body rendering.
+
+Lesson content is rendered once when the lesson is saved and stored as
+``Lesson.content_html``, so lesson pages output the stored HTML instead of
+formatting the raw text on every request. Content is Markdown (with tables,
+fenced code and hard line breaks) sanitized to a safe tag allowlist when the
+optional Markdown and nh3 packages are installed, and escaped plain text with
+paragraphs and line breaks otherwise. Run ``render_lessons`` after installing
+them or changing the rendering to refresh the stored bodies.
+"""
+from django.utils.html import linebreaks
+
+try:
+    import markdown
+    import nh3
+except ImportError:
+    markdown = nh3 = None
+
+MARKDOWN_EXTENSIONS = ['extra', 'nl2br', 'sane_lists']
+
+def render_lesson_content(text):
+    """Ready-to-serve HTML for a lesson's raw content"""
+    if markdown is None:
+        return linebreaks(text, autoescape=True)
+    html = markdown.markdown(text, extensions=MARKDOWN_EXTENSIONS, output_format='html')
+    # Raw HTML in the source passes through Markdown, so clean the result
+    return nh3.clean(html, link_rel='noopener noreferrer')
@@ -1,10 +1,26 @@
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models import Q, QuerySet
+from django.db.models.signals import post_save, post_delete, pre_delete
 from django.dispatch import receiver
 from .models import (
     User, StudentProfile, InstructorProfile, 
-    ModuleProgress, StudentBadge, Enrollment,
-    AssignmentSubmission, QuizAttempt, LessonProgress
+    ModuleProgress, Badge, StudentBadge, Enrollment, Course, Module,
+    Lesson, Assignment, AssignmentSubmission, Quiz, Question, QuizAttempt, QuizBestAttempt, LessonProgress
 )
+from .access import invalidate_course_access
+from .badges import award_badges, award_course_completion_badges
+from .caching import bump_version
+from .catalog import invalidate_catalog
+from .dashboards import invalidate_course_dashboards, invalidate_instructor_dashboard, invalidate_student_dashboards
+from .outline import invalidate_outline
+from .grading import invalidate_answer_key, request_regrade
+from .progress import defer, defer_best_attempt_refresh, is_deferred, mark_dirty
+
+def _deleted_directly(sender, origin):
+    """True when the delete was issued on sender itself rather than cascaded from a parent"""
+    if isinstance(origin, QuerySet):
+        return origin.model is sender
+    return isinstance(origin, sender)
 
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
@@ -18,10 +34,11 @@ def create_user_profile(sender, instance, created, **kwargs):
 @receiver(post_save, sender=User)
 def save_user_profile(sender, instance, **kwargs):
     """Save profile when user is saved"""
+    # Only touch updated_at so a stale cached profile never overwrites the maintained counters
     if instance.role == 'student' and hasattr(instance, 'student_profile'):
-        instance.student_profile.save()
+        instance.student_profile.save(update_fields=['updated_at'])
     elif instance.role == 'instructor' and hasattr(instance, 'instructor_profile'):
-        instance.instructor_profile.save()
+        instance.instructor_profile.save(update_fields=['updated_at'])
 
 @receiver(post_save, sender=ModuleProgress)
 def check_module_completion_badge(sender, instance, created, **kwargs):
@@ -30,179 +47,337 @@ def check_module_completion_badge(sender, instance, created, **kwargs):
         # This is handled in the model's award_module_badge method
         pass
 
+@receiver(post_save, sender=Badge)
+@receiver(post_delete, sender=Badge)
+def invalidate_badge_catalog(sender, **kwargs):
+    """Make every worker reload its cached badge catalog"""
+    transaction.on_commit(lambda: bump_version('badges'))
+
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+def invalidate_quiz_answer_key(sender, instance, **kwargs):
+    """Make graders reload the quiz's answer key after its questions change"""
+    invalidate_answer_key(instance.quiz_id)
+
+@receiver(post_save, sender=Question)
+def regrade_on_question_change(sender, instance, created, **kwargs):
+    """Regrade existing attempts when a question's correct answer or marks change"""
+    graded_as = (instance.correct_answer, instance.marks)
+    previous = getattr(instance, '_graded_as', None)
+    instance._graded_as = graded_as
+    if not created and previous != graded_as:
+        request_regrade(instance.quiz_id)
+
+@receiver(post_delete, sender=Question)
+def regrade_on_question_delete(sender, instance, origin=None, **kwargs):
+    """Rescore existing attempts without a question that was deleted on its own"""
+    if _deleted_directly(sender, origin):
+        request_regrade(instance.quiz_id)
+
 @receiver(post_save, sender=StudentBadge)
 def update_profiles_on_badge_award(sender, instance, created, **kwargs):
     """Update profiles when badge is awarded"""
     if created:
-        # Update student profile
-        if hasattr(instance.student, 'student_profile'):
-            instance.student.student_profile.update_stats()
+        StudentProfile.add_counts('total_badges_earned', [instance.student_id])
         
         # Update instructor profile if manually awarded
-        if instance.is_instructor_awarded and instance.awarded_by:
-            if hasattr(instance.awarded_by, 'instructor_profile'):
-                instance.awarded_by.instructor_profile.update_stats()
+        if instance.is_instructor_awarded and instance.awarded_by_id:
+            InstructorProfile.add_counts('total_badges_awarded', [instance.awarded_by_id])
+
+@receiver(post_delete, sender=StudentBadge)
+def update_profiles_on_badge_revoke(sender, instance, origin=None, **kwargs):
+    """Update profiles when an awarded badge is deleted on its own"""
+    if _deleted_directly(sender, origin):
+        StudentProfile.add_counts('total_badges_earned', [instance.student_id], sign=-1)
+        if instance.is_instructor_awarded and instance.awarded_by_id:
+            InstructorProfile.add_counts('total_badges_awarded', [instance.awarded_by_id], sign=-1)
+
+def _has_other_enrollment(student_id, instructor_id, exclude_pk):
+    return Enrollment.objects.filter(
+        student=student_id,
+        course__instructor=instructor_id
+    ).exclude(pk=exclude_pk).exists()
 
 @receiver(post_save, sender=Enrollment)
 def update_student_profile_on_enrollment(sender, instance, created, **kwargs):
-    """Update student profile when enrolled in course"""
+    """Update profiles when enrolled in course"""
     if created:
-        if hasattr(instance.student, 'student_profile'):
-            instance.student.student_profile.update_stats()
+        StudentProfile.add_counts('total_courses_enrolled', [instance.student_id])
+        instructor_id = instance.course.instructor_id
+        if not _has_other_enrollment(instance.student_id, instructor_id, instance.pk):
+            InstructorProfile.add_counts('total_students', [instructor_id])
         # Initialize progress
-        instance.update_progress()
+        if is_deferred():
+            mark_dirty(instance.student_id, instance.course_id)
+        else:
+            instance.update_progress()
 
-# Update progress when assignments are graded
-from django.db.models.signals import post_save
-from .models import AssignmentSubmission, QuizAttempt
+@receiver(post_delete, sender=Enrollment)
+def update_profiles_on_unenrollment(sender, instance, origin=None, **kwargs):
+    """Update profiles when an enrollment is deleted on its own"""
+    if _deleted_directly(sender, origin):
+        StudentProfile.add_counts('total_courses_enrolled', [instance.student_id], sign=-1)
+        if instance.completed_at:
+            StudentProfile.add_counts('total_courses_completed', [instance.student_id], sign=-1)
+        instructor_id = instance.course.instructor_id
+        if not _has_other_enrollment(instance.student_id, instructor_id, instance.pk):
+            InstructorProfile.add_counts('total_students', [instructor_id], sign=-1)
+
+@receiver(post_delete, sender=ModuleProgress)
+def update_profile_on_module_progress_delete(sender, instance, origin=None, **kwargs):
+    """Drop a completed module from the student's counter when its progress row is deleted on its own"""
+    if instance.is_completed and _deleted_directly(sender, origin):
+        StudentProfile.add_counts('total_modules_completed', [instance.student_id], sign=-1)
+
+@receiver(post_save, sender=Course)
+def update_instructor_profile_on_course_created(sender, instance, created, **kwargs):
+    """Count a new course towards its instructor's profile"""
+    if created:
+        InstructorProfile.add_counts('total_courses_created', [instance.instructor_id])
+
+def _reconcile_profiles_on_commit(student_ids, instructor_ids):
+    """Recount the given profiles once a cascading delete has committed"""
+    def reconcile():
+        StudentProfile.reconcile_stats(StudentProfile.objects.filter(user__in=student_ids))
+        InstructorProfile.reconcile_stats(InstructorProfile.objects.filter(user__in=instructor_ids))
+    transaction.on_commit(reconcile)
+
+# Cascading deletes of courses, modules and badges fan out to many rows, so the
+# affected profiles are recounted set-based instead of decremented row by row
+def _award_holders(awards):
+    """Students holding the given badge awards, and the instructors who handed them out"""
+    return (
+        set(awards.values_list('student_id', flat=True).distinct()),
+        set(awards.filter(is_instructor_awarded=True).values_list('awarded_by_id', flat=True).distinct())
+    )
+
+@receiver(pre_delete, sender=Course)
+def update_profiles_on_course_delete(sender, instance, **kwargs):
+    # Students who left the course can still hold its badges and completed modules
+    student_ids, instructor_ids = _award_holders(
+        StudentBadge.objects.filter(Q(course=instance) | Q(module__course=instance))
+    )
+    student_ids.update(Enrollment.objects.filter(course=instance).values_list('student_id', flat=True))
+    student_ids.update(
+        ModuleProgress.objects.filter(module__course=instance, is_completed=True).values_list('student_id', flat=True)
+    )
+    instructor_ids.add(instance.instructor_id)
+    _reconcile_profiles_on_commit(student_ids, instructor_ids)
+
+@receiver(pre_delete, sender=Module)
+def update_profiles_on_module_delete(sender, instance, origin=None, **kwargs):
+    if _deleted_directly(sender, origin):
+        student_ids, instructor_ids = _award_holders(StudentBadge.objects.filter(module=instance))
+        student_ids.update(
+            ModuleProgress.objects.filter(module=instance, is_completed=True).values_list('student_id', flat=True)
+        )
+        _reconcile_profiles_on_commit(student_ids, instructor_ids)
+
+@receiver(pre_delete, sender=Badge)
+def update_profiles_on_badge_delete(sender, instance, **kwargs):
+    _reconcile_profiles_on_commit(*_award_holders(StudentBadge.objects.filter(badge=instance)))
 
+# Keep enrollment item counters in step with the course's assignments and quizzes
+@receiver(post_save, sender=Assignment)
+@receiver(post_save, sender=Quiz)
+def update_progress_totals_on_item_created(sender, instance, created, **kwargs):
+    """Count a new assignment or quiz towards every enrollment in its course"""
+    if created:
+        enrollments = Enrollment.objects.filter(course_id=instance.course_id)
+        Enrollment.apply_progress_delta(enrollments, total=1)
+        # A new outstanding item reopens the course for students who had completed it
+        Enrollment.sync_completion(enrollments, gained=False)
+
+def _remove_course_item(course_id, completed_by):
+    """Drop a deleted item from the course totals and from the students who completed it"""
+    enrollments = Enrollment.objects.filter(course_id=course_id)
+    Enrollment.apply_progress_delta(enrollments.filter(student__in=completed_by), completed=-1, total=-1)
+    Enrollment.apply_progress_delta(enrollments.exclude(student__in=completed_by), total=-1)
+    # Removing an item can complete the course for the remaining students (or reopen an emptied one)
+    Enrollment.sync_completion(enrollments)
+    award_course_completion_badges(enrollments)
+
+@receiver(pre_delete, sender=Assignment)
+def update_progress_totals_on_assignment_delete(sender, instance, origin=None, **kwargs):
+    """Remove a deleted assignment from its course's enrollment counters"""
+    if _deleted_directly(sender, origin):
+        _remove_course_item(
+            instance.course_id,
+            AssignmentSubmission.objects.filter(assignment=instance, marks__isnull=False).values('student')
+        )
+
+@receiver(pre_delete, sender=Quiz)
+def update_progress_totals_on_quiz_delete(sender, instance, origin=None, **kwargs):
+    """Remove a deleted quiz from its course's enrollment counters"""
+    if _deleted_directly(sender, origin):
+        _remove_course_item(
+            instance.course_id,
+            QuizBestAttempt.objects.filter(quiz=instance).values('student')
+        )
+
+# Update progress when assignments are graded
 @receiver(post_save, sender=AssignmentSubmission)
 def update_progress_on_assignment(sender, instance, **kwargs):
     """Update course progress and award badges when assignment is graded"""
-    if instance.marks is not None:
-        from .models import Badge, StudentBadge
-        
-        # Update course progress
+    is_graded = instance.marks is not None
+    was_graded = instance.was_graded
+    instance._was_graded = is_graded
+    if defer(instance):
+        return
+    
+    # Update course progress
+    if was_graded is None:
+        # Previous state unknown (deferred field), fall back to a recount
         enrollment = Enrollment.objects.filter(
-            student=instance.student,
-            course=instance.assignment.course
+            student=instance.student_id,
+            course=instance.assignment.course_id
         ).first()
         if enrollment:
             enrollment.update_progress()
-        
-        # Award badge for completing assignment (any score)
-        completion_badge = Badge.objects.filter(
-            badge_type='assignment_ace',
-            name='Assignment Completed'
-        ).first()
-        
-        if not completion_badge:
-            completion_badge = Badge.objects.create(
-                name='Assignment Completed',
-                badge_type='assignment_ace',
-                description='Completed an assignment',
-                icon='✅'
-            )
-        
-        StudentBadge.objects.get_or_create(
-            student=instance.student,
-            badge=completion_badge,
-            course=instance.assignment.course,
-            defaults={'is_instructor_awarded': False}
+    elif is_graded != was_graded:
+        Enrollment.record_item_completion(
+            instance.student_id,
+            instance.assignment.course_id,
+            1 if is_graded else -1
         )
-        
-        # Auto-award Assignment Ace badge for 90%+ score
-        percentage = (instance.marks / instance.assignment.max_marks) * 100
-        if percentage >= 90:
-            ace_badge = Badge.objects.filter(
-                badge_type='assignment_ace',
-                name='Assignment Ace'
-            ).first()
-            
-            if not ace_badge:
-                ace_badge = Badge.objects.create(
-                    name='Assignment Ace',
-                    badge_type='assignment_ace',
-                    description='Scored 90%+ on assignment',
-                    icon='📝'
-                )
-            
-            StudentBadge.objects.get_or_create(
-                student=instance.student,
-                badge=ace_badge,
-                course=instance.assignment.course,
-                defaults={'is_instructor_awarded': False}
-            )
+        mark_dirty(instance.student_id, instance.assignment.course_id)
+    
+    if is_graded:
+        award_badges('assignment_graded', instance, instance.student_id, instance.assignment.course_id)
 
 @receiver(post_save, sender=QuizAttempt)
 def update_progress_on_quiz(sender, instance, **kwargs):
-    """Update course progress and award badges when quiz is completed"""
-    if instance.is_completed:
-        from .models import Badge, StudentBadge
-        
-        # Update course progress
+    """Update the best attempt, course progress and badges when quiz is completed"""
+    was_completed = instance.was_completed
+    instance._was_completed = instance.is_completed
+    
+    # Keep the best-attempt row in step within the completing transaction
+    first_completion = False
+    if instance.is_completed and was_completed is False:
+        first_completion = QuizBestAttempt.record(instance)
+    elif instance.is_completed or was_completed is not False:
+        # Score edited, completion undone or previous state unknown: rebuild from the attempts
+        QuizBestAttempt.refresh([(instance.student_id, instance.quiz_id)])
+    if defer(instance):
+        return
+    
+    # Update course progress; only a student's first completed attempt completes the quiz
+    if first_completion:
+        Enrollment.record_item_completion(instance.student_id, instance.quiz.course_id, 1)
+        mark_dirty(instance.student_id, instance.quiz.course_id)
+    elif was_completed is None or (was_completed and not instance.is_completed):
         enrollment = Enrollment.objects.filter(
-            student=instance.student,
-            course=instance.quiz.course
+            student=instance.student_id,
+            course=instance.quiz.course_id
         ).first()
         if enrollment:
             enrollment.update_progress()
-        
-        # Award badge for completing quiz (any score)
-        completion_badge = Badge.objects.filter(
-            badge_type='quiz_master',
-            name='Quiz Completed'
-        ).first()
-        
-        if not completion_badge:
-            completion_badge = Badge.objects.create(
-                name='Quiz Completed',
-                badge_type='quiz_master',
-                description='Completed a quiz',
-                icon='✅'
-            )
-        
-        StudentBadge.objects.get_or_create(
-            student=instance.student,
-            badge=completion_badge,
-            course=instance.quiz.course,
-            defaults={'is_instructor_awarded': False}
-        )
-        
-        # Auto-award Quiz Master badge for 90%+ score
-        if instance.score and instance.quiz.max_marks:
-            percentage = (instance.score / instance.quiz.max_marks) * 100
-            if percentage >= 90:
-                master_badge = Badge.objects.filter(
-                    badge_type='quiz_master',
-                    name='Quiz Master'
-                ).first()
-                
-                if not master_badge:
-                    master_badge = Badge.objects.create(
-                        name='Quiz Master',
-                        badge_type='quiz_master',
-                        description='Scored 90%+ on quiz',
-                        icon='🧠'
-                    )
-                
-                StudentBadge.objects.get_or_create(
-                    student=instance.student,
-                    badge=master_badge,
-                    course=instance.quiz.course,
-                    defaults={'is_instructor_awarded': False}
-                )
-            
-            # Auto-award Perfect Score badge for 100%
-            if percentage == 100:
-                perfect_badge = Badge.objects.filter(
-                    badge_type='perfect_score',
-                    name='Perfect Score'
-                ).first()
-                
-                if not perfect_badge:
-                    perfect_badge = Badge.objects.create(
-                        name='Perfect Score',
-                        badge_type='perfect_score',
-                        description='Achieved 100% score',
-                        icon='💯'
-                    )
-                
-                StudentBadge.objects.get_or_create(
-                    student=instance.student,
-                    badge=perfect_badge,
-                    course=instance.quiz.course,
-                    defaults={'is_instructor_awarded': False}
-                )
+    
+    if instance.is_completed:
+        award_badges('quiz_completed', instance, instance.student_id, instance.quiz.course_id)
 
+@receiver(post_delete, sender=AssignmentSubmission)
+def update_progress_on_submission_delete(sender, instance, origin=None, **kwargs):
+    """Drop the completed item when a graded submission is deleted on its own"""
+    if instance.marks is not None and _deleted_directly(sender, origin):
+        if is_deferred():
+            mark_dirty(instance.student_id, instance.assignment.course_id)
+        else:
+            Enrollment.record_item_completion(instance.student_id, instance.assignment.course_id, -1)
+
+@receiver(post_delete, sender=QuizAttempt)
+def update_progress_on_attempt_delete(sender, instance, origin=None, **kwargs):
+    """Rebuild the best attempt, dropping the completed item with the last one, when a completed attempt is deleted on its own"""
+    if instance.is_completed and _deleted_directly(sender, origin):
+        # Bulk deletes rebuild every affected best attempt once, on commit
+        if defer_best_attempt_refresh(instance.student_id, instance.quiz_id):
+            return
+        if not QuizBestAttempt.refresh([(instance.student_id, instance.quiz_id)]):
+            # Recount rather than decrement: several attempts may go in one delete
+            Enrollment.reconcile_counters(
+                Enrollment.objects.filter(student=instance.student_id, course=instance.quiz.course_id)
+            )
 
 @receiver(post_save, sender=LessonProgress)
 def update_progress_on_lesson(sender, instance, **kwargs):
-    """Update course progress when lesson is completed"""
-    if instance.is_completed:
-        enrollment = Enrollment.objects.filter(
-            student=instance.student,
-            course=instance.lesson.module.course
-        ).first()
-        if enrollment:
-            enrollment.update_progress()
+    """Queue module progress recomputation when a lesson is completed"""
+    if instance.is_completed and not defer(instance):
+        mark_dirty(instance.student_id, instance.lesson.module.course_id)
+
+# Cached student dashboards
+@receiver(post_save, sender=Enrollment)
+@receiver(post_delete, sender=Enrollment)
+@receiver(post_save, sender=AssignmentSubmission)
+@receiver(post_delete, sender=AssignmentSubmission)
+@receiver(post_save, sender=QuizAttempt)
+@receiver(post_delete, sender=QuizAttempt)
+@receiver(post_save, sender=StudentBadge)
+@receiver(post_delete, sender=StudentBadge)
+@receiver(post_save, sender=LessonProgress)
+@receiver(post_delete, sender=LessonProgress)
+def invalidate_student_dashboard(sender, instance, **kwargs):
+    """Move the student's version stamp when their enrollments, grades, attempts, badges or lesson progress change"""
+    invalidate_student_dashboards([instance.student_id])
+
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+def invalidate_dashboards_on_course_change(sender, instance, **kwargs):
+    """Course details appear in the catalog and on enrolled students' and the instructor's dashboards"""
+    invalidate_catalog()
+    invalidate_course_dashboards(instance.pk)
+    invalidate_instructor_dashboard(instance.instructor_id)
+
+@receiver(post_save, sender=Module)
+@receiver(post_delete, sender=Module)
+@receiver(post_save, sender=Assignment)
+@receiver(post_delete, sender=Assignment)
+@receiver(post_save, sender=Quiz)
+@receiver(post_delete, sender=Quiz)
+def invalidate_dashboards_on_course_content_change(sender, instance, **kwargs):
+    """Module counts, assignments and quizzes are listed on enrolled students' dashboards"""
+    if sender is not Assignment:
+        # Catalog cards show module and quiz counts too
+        invalidate_catalog()
+    invalidate_course_dashboards(instance.course_id)
+
+@receiver(post_save, sender=Lesson)
+@receiver(post_delete, sender=Lesson)
+def invalidate_catalog_on_lesson_change(sender, instance, **kwargs):
+    """Catalog cards show lesson counts"""
+    invalidate_catalog()
+
+# Cached course outlines
+@receiver(post_save, sender=Module)
+@receiver(post_delete, sender=Module)
+@receiver(post_save, sender=Assignment)
+@receiver(post_delete, sender=Assignment)
+@receiver(post_save, sender=Quiz)
+@receiver(post_delete, sender=Quiz)
+def invalidate_course_outline(sender, instance, **kwargs):
+    """Rebuild the course outline after its modules, assignments or quizzes change"""
+    invalidate_outline(instance.course_id)
+
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+def invalidate_course_outline_on_course_change(sender, instance, **kwargs):
+    """Course details are served alongside the outline, so ETags on course pages move with it"""
+    invalidate_outline(instance.pk)
+
+@receiver(post_save, sender=Lesson)
+@receiver(post_delete, sender=Lesson)
+def invalidate_course_outline_on_lesson_change(sender, instance, origin=None, **kwargs):
+    """Rebuild the course outline after a lesson is added, edited, reordered or deleted on its own"""
+    # Lessons deleted with their module or course are covered by that delete
+    if origin is None or _deleted_directly(sender, origin):
+        invalidate_outline(instance.module.course_id)
+
+# Cached course access checks
+@receiver(post_save, sender=Enrollment)
+@receiver(post_delete, sender=Enrollment)
+def invalidate_student_course_access(sender, instance, **kwargs):
+    invalidate_course_access([instance.student_id])
+
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+def invalidate_instructor_course_access(sender, instance, **kwargs):
+    invalidate_course_access([instance.instructor_id])
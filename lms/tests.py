@@ -0,0 +1,448 @@
+import datetime
+import threading
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.db import connection
+from django.db.models.signals import post_save
+from django.test import Client, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .grading import start_attempt, submit_attempt
+from .models import (
+    Assignment, AssignmentSubmission, Badge, Course, Enrollment, InstructorProfile, Lesson, LessonProgress, Module,
+    Question, Quiz, QuizAnswer, QuizAttempt, QuizBestAttempt, StudentBadge, StudentProfile, User
+)
+from . import analytics
+from .dashboards import student_dashboard_version
+from .progress import deferred_progress
+from .query_budget import budget_for, load_budgets, violation_counts
+
+# Version stamps and cached pages must not leak into the shared file cache
+TEST_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+def _seed_course(scale):
+    """
+    A published course with scale modules of scale lessons, scale assignments and
+    scale quizzes of scale * 2 questions, and scale * 5 enrolled students who have
+    completed some lessons, submitted every assignment (half graded), completed
+    every quiz but the last and left the last one open.
+    """
+    instructor = User.objects.create(username='instructor', role='instructor')
+    students = [User.objects.create(username=f'student_{number}', role='student') for number in range(scale * 5)]
+    course = Course.objects.create(title='Course', description='Course', instructor=instructor, is_published=True)
+    for student in students:
+        Enrollment.objects.create(student=student, course=course)
+
+    lessons = []
+    for order in range(scale):
+        module = Module.objects.create(course=course, title=f'Module {order}', description='Module', order=order)
+        lessons += [
+            Lesson.objects.create(module=module, title=f'Lesson {order}.{number}', content='Lesson body', order=number)
+            for number in range(scale)
+        ]
+    assignments = [
+        Assignment.objects.create(
+            course=course, title=f'Assignment {number}', description='Assignment', due_date=datetime.date.today()
+        )
+        for number in range(scale)
+    ]
+    quizzes = [
+        Quiz.objects.create(course=course, title=f'Quiz {number}', description='Quiz', max_marks=scale * 2)
+        for number in range(scale)
+    ]
+    for quiz in quizzes:
+        Question.objects.bulk_create([
+            Question(
+                quiz=quiz, question_text=f'Question {order}', option_a='A', option_b='B', option_c='C',
+                option_d='D', correct_answer='ABCD'[order % 4], marks=1, order=order
+            )
+            for order in range(scale * 2)
+        ])
+
+    for index, student in enumerate(students):
+        for lesson in lessons[:index % len(lessons) + 1]:
+            LessonProgress.objects.create(student=student, lesson=lesson, is_completed=True, completed_at=timezone.now())
+        for assignment in assignments:
+            submission = AssignmentSubmission.objects.create(assignment=assignment, student=student, text_answer='Answer')
+            if index % 2:
+                submission.marks = 50 + index
+                submission.graded_at = timezone.now()
+                submission.save()
+        for quiz in quizzes:
+            attempt, _ = start_attempt(quiz, student)
+            if quiz is not quizzes[-1]:
+                submit_attempt(attempt, {question.pk: 'A' for question in quiz.questions.all()})
+
+    return {
+        'course': course,
+        'instructor': instructor,
+        'students': students,
+        'lessons': lessons,
+        'assignments': assignments,
+        'quizzes': quizzes,
+    }
+
+@override_settings(CACHES=TEST_CACHES, LMS_PROGRESS_QUEUE_EAGER=False)
+class QueryBudgetTests(TestCase):
+    """Every view in query_budgets.json stays within its budget, cold and warm, at the fixture's scale"""
+    SCALE = 2
+
+    @classmethod
+    def setUpTestData(cls):
+        fixture = _seed_course(cls.SCALE)
+        student, instructor = fixture['students'][0], fixture['instructor']
+        course_id = fixture['course'].pk
+        assignment_id = fixture['assignments'][0].pk
+        quiz_id = fixture['quizzes'][0].pk
+        completed_attempt = QuizAttempt.objects.get(quiz=quiz_id, student=student)
+        open_attempt = cls.open_attempt = QuizAttempt.objects.get(quiz=fixture['quizzes'][-1], student=student)
+        cls.cases = [
+            ('dashboard', student, reverse('dashboard')),
+            ('dashboard', instructor, reverse('dashboard')),
+            ('course_list', student, reverse('course_list')),
+            ('course_detail', student, reverse('course_detail', args=[course_id])),
+            ('course_detail', instructor, reverse('course_detail', args=[course_id])),
+            ('lesson_detail', student, reverse('lesson_detail', args=[fixture['lessons'][0].pk])),
+            ('assignment_detail', student, reverse('assignment_detail', args=[assignment_id])),
+            ('assignment_detail', instructor, reverse('assignment_detail', args=[assignment_id])),
+            ('quiz_detail', student, reverse('quiz_detail', args=[quiz_id])),
+            ('quiz_detail', instructor, reverse('quiz_detail', args=[quiz_id])),
+            ('quiz_attempt', student, reverse('quiz_attempt', args=[open_attempt.pk])),
+            ('quiz_result', student, reverse('quiz_result', args=[completed_attempt.pk])),
+            ('student_profile', student, reverse('student_profile')),
+            ('instructor_profile', instructor, reverse('instructor_profile')),
+            ('progress_dashboard', student, reverse('progress_dashboard')),
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_budgeted_views_are_exercised(self):
+        self.assertEqual(set(load_budgets()), {url_name for url_name, _, _ in self.cases})
+
+    def test_views_stay_within_budget(self):
+        for url_name, user, url in self.cases:
+            budget = budget_for(url_name, user.role)
+            self.assertIsNotNone(budget, f'{url_name} has no budget for {user.role}s')
+            client = Client()
+            client.force_login(user)
+            for state in ('cold', 'warm'):
+                with self.subTest(view=url_name, role=user.role, cache=state):
+                    with CaptureQueriesContext(connection) as queries:
+                        response = client.get(url)
+                    self.assertEqual(response.status_code, 200)
+                    self.assertLessEqual(
+                        len(queries), budget,
+                        f'{url_name} ({user.role}, {state}) ran {len(queries)} queries, budget {budget}:\n'
+                        + '\n'.join(query['sql'] for query in queries.captured_queries)
+                    )
+
+    @override_settings(LMS_QUERY_BUDGET_SAMPLE_RATE=1)
+    def test_middleware_skips_writes(self):
+        client = Client()
+        client.force_login(self.open_attempt.student)
+        answers = {f'question_{question.pk}': 'A' for question in self.open_attempt.quiz.questions.all()}
+        response = client.post(reverse('quiz_attempt', args=[self.open_attempt.pk]), answers)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(violation_counts(), {})
+
+class ScaledQueryBudgetTests(QueryBudgetTests):
+    """The same budgets hold with three times the rows, so per-row queries fail"""
+    SCALE = 6
+
+@override_settings(CACHES=TEST_CACHES, LMS_PROGRESS_QUEUE_EAGER=False)
+class DeferredProgressTests(TestCase):
+    """Bulk writes inside deferred_progress cost a fixed number of queries to flush, however many rows they touch"""
+
+    def setUp(self):
+        cache.clear()
+        self.instructor = User.objects.create(username='instructor', role='instructor')
+
+    def _course(self, name, student_count):
+        course = Course.objects.create(title=name, description=name, instructor=self.instructor)
+        module = Module.objects.create(course=course, title='Module', description='Module')
+        lesson = Lesson.objects.create(module=module, title='Lesson', content='Lesson body')
+        assignment = Assignment.objects.create(
+            course=course, title='Assignment', description='Assignment', due_date=datetime.date.today()
+        )
+        quiz = Quiz.objects.create(course=course, title='Quiz', description='Quiz', max_marks=1)
+        question = Question.objects.create(
+            quiz=quiz, question_text='Question', option_a='A', option_b='B', option_c='C', option_d='D',
+            correct_answer='A', marks=1
+        )
+        students = [User.objects.create(username=f'{name}_{number}', role='student') for number in range(student_count)]
+        for student in students:
+            Enrollment.objects.create(student=student, course=course)
+        return students, lesson, assignment, quiz, question
+
+    def _flush_queries(self, callbacks):
+        with CaptureQueriesContext(connection) as queries:
+            for callback in callbacks:
+                callback()
+        return len(queries)
+
+    def _save_rows(self, name, student_count):
+        """Queries run by the deferred flush after one lesson, submission and attempt per student"""
+        students, lesson, assignment, quiz, question = self._course(name, student_count)
+        with self.captureOnCommitCallbacks() as callbacks:
+            with deferred_progress():
+                for student in students:
+                    LessonProgress.objects.create(student=student, lesson=lesson, is_completed=True)
+                    AssignmentSubmission.objects.create(
+                        assignment=assignment, student=student, text_answer='Answer', marks=90, graded_at=timezone.now()
+                    )
+                    attempt = QuizAttempt.objects.create(quiz=quiz, student=student)
+                    QuizAnswer.objects.create(attempt=attempt, question=question, selected_answer='A', is_correct=True)
+                    attempt.score = 1
+                    attempt.is_completed = True
+                    attempt.submitted_at = timezone.now()
+                    attempt.save()
+        return self._flush_queries(callbacks), students, quiz
+
+    def test_flush_cost_is_flat_for_saves(self):
+        # The first flush creates the badge definitions
+        self._save_rows('warm', 1)
+        small, students, quiz = self._save_rows('small', 5)
+        large, _, _ = self._save_rows('large', 10)
+        self.assertEqual(small, large)
+
+        enrollment = Enrollment.objects.get(student=students[0], course=quiz.course)
+        self.assertEqual(enrollment.completed_items, 2)
+        self.assertEqual(enrollment.progress, 100)
+        self.assertTrue(StudentBadge.objects.filter(student=students[0], badge__name='Perfect Score').exists())
+
+    def _delete_attempts(self, name, student_count):
+        """Queries run by a bulk attempt delete and by its deferred flush"""
+        _, students, quiz = self._save_rows(name, student_count)
+        with self.captureOnCommitCallbacks() as callbacks:
+            with CaptureQueriesContext(connection) as queries:
+                with deferred_progress():
+                    QuizAttempt.objects.filter(quiz=quiz).delete()
+        return len(queries), self._flush_queries(callbacks), students, quiz
+
+    def test_attempt_delete_cost_is_flat(self):
+        self._delete_attempts('warm', 1)
+        small_delete, small_flush, _, _ = self._delete_attempts('small', 5)
+        large_delete, large_flush, students, quiz = self._delete_attempts('large', 10)
+        self.assertEqual(small_delete, large_delete)
+        self.assertEqual(small_flush, large_flush)
+
+        self.assertFalse(QuizBestAttempt.objects.filter(quiz=quiz).exists())
+        enrollment = Enrollment.objects.get(student=students[0], course=quiz.course)
+        self.assertEqual(enrollment.completed_items, 1)
+
+@override_settings(CACHES=TEST_CACHES)
+class DashboardVersionTests(TestCase):
+    """Course changes move enrolled students' dashboard versions with a single cache write"""
+
+    def setUp(self):
+        cache.clear()
+        instructor = User.objects.create(username='instructor', role='instructor')
+        self.course = Course.objects.create(title='Course', description='Course', instructor=instructor)
+        self.students = [User.objects.create(username=f'student_{number}', role='student') for number in range(20)]
+        for student in self.students:
+            Enrollment.objects.create(student=student, course=self.course)
+        self.other = User.objects.create(username='other', role='student')
+
+    def test_course_edit_moves_enrolled_dashboards(self):
+        before = student_dashboard_version(self.students[0].pk)
+        other_before = student_dashboard_version(self.other.pk)
+        with self.captureOnCommitCallbacks() as callbacks:
+            Quiz.objects.create(course=self.course, title='Quiz', description='Quiz')
+        with CaptureQueriesContext(connection) as queries, \
+                patch.object(cache, 'set', wraps=cache.set) as set_one, \
+                patch.object(cache, 'set_many', wraps=cache.set_many) as set_many:
+            for callback in callbacks:
+                callback()
+        writes = [call.args[0] for call in set_one.call_args_list]
+        writes += [key for call in set_many.call_args_list for key in call.args[0]]
+        self.assertEqual(len(queries), 0)
+        # The catalog, course dashboards and course outline stamps; none per student
+        self.assertEqual(sorted(writes), [
+            'lms:version:catalog',
+            f'lms:version:course_dashboards:{self.course.pk}',
+            f'lms:version:course_outline:{self.course.pk}',
+        ])
+        self.assertNotEqual(student_dashboard_version(self.students[0].pk), before)
+        self.assertEqual(student_dashboard_version(self.other.pk), other_before)
+
+@override_settings(CACHES=TEST_CACHES, LMS_PROGRESS_QUEUE_EAGER=False)
+class ItemAnalysisTests(TestCase):
+    """Folding answers in batches gives the same statistics as folding them at once"""
+
+    def setUp(self):
+        cache.clear()
+        instructor = User.objects.create(username='instructor', role='instructor')
+        course = Course.objects.create(title='Course', description='Course', instructor=instructor)
+        self.quiz = Quiz.objects.create(course=course, title='Quiz', description='Quiz', max_marks=4)
+        questions = [
+            Question.objects.create(
+                quiz=self.quiz, question_text=f'Question {order}', option_a='A', option_b='B', option_c='C',
+                option_d='D', correct_answer='ABCD'[order], marks=1, order=order
+            )
+            for order in range(4)
+        ]
+        for number in range(12):
+            student = User.objects.create(username=f'student_{number}', role='student')
+            Enrollment.objects.create(student=student, course=course)
+            attempt, _ = start_attempt(self.quiz, student)
+            # Varied answers, some left blank
+            submit_attempt(attempt, {
+                question.pk: 'ABCD'[(number + question.order * number) % 4]
+                for question in questions if (number + question.order) % 5
+            })
+        # Half the attempts are settled and cached, the rest are recent
+        settled = QuizAttempt.objects.filter(quiz=self.quiz).order_by('pk')[:6]
+        QuizAttempt.objects.filter(pk__in=list(settled.values_list('pk', flat=True))).update(
+            submitted_at=timezone.now() - analytics.SETTLE_DELAY * 2
+        )
+
+    def test_batches_match_single_fold(self):
+        whole = analytics.item_analysis(self.quiz.pk)
+        cache.clear()
+        with patch.object(analytics, 'ANSWER_BATCH', 3):
+            batched = analytics.item_analysis(self.quiz.pk)
+        self.assertEqual(whole['attempts'], 12)
+        self.assertEqual(batched['attempts'], 12)
+        for question_id, stats in whole['questions'].items():
+            other = batched['questions'][question_id]
+            self.assertAlmostEqual(stats['p_value'], other['p_value'])
+            self.assertEqual(stats['discrimination'] is None, other['discrimination'] is None)
+            if stats['discrimination'] is not None:
+                self.assertAlmostEqual(stats['discrimination'], other['discrimination'])
+            for label, share in stats['options'].items():
+                self.assertAlmostEqual(share, other['options'][label])
+
+@override_settings(CACHES=TEST_CACHES, LMS_PROGRESS_QUEUE_EAGER=False)
+class ProfileCounterTests(TestCase):
+    """Profile counters match a recount after cascading deletes"""
+
+    def test_course_delete_recounts_former_students(self):
+        instructor = User.objects.create(username='instructor', role='instructor')
+        student = User.objects.create(username='student', role='student')
+        course = Course.objects.create(title='Course', description='Course', instructor=instructor)
+        module = Module.objects.create(course=course, title='Module', description='Module')
+        enrollment = Enrollment.objects.create(student=student, course=course)
+        badge = Badge.objects.create(name='Star', description='Star', badge_type='module_complete')
+        StudentBadge.objects.create(student=student, badge=badge, course=course)
+        StudentBadge.objects.create(
+            student=student, badge=badge, module=module, awarded_by=instructor, is_instructor_awarded=True
+        )
+        enrollment.delete()
+        self.assertEqual(StudentProfile.objects.get(user=student).total_badges_earned, 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            course.delete()
+        self.assertEqual(StudentProfile.objects.get(user=student).total_badges_earned, 0)
+        self.assertEqual(InstructorProfile.objects.get(user=instructor).total_badges_awarded, 0)
+
+@override_settings(CACHES=TEST_CACHES, LMS_PROGRESS_QUEUE_EAGER=False)
+class QuizAutosaveTests(TestCase):
+    """Autosave stores, clears and validates answers of an open attempt"""
+
+    def setUp(self):
+        cache.clear()
+        instructor = User.objects.create(username='instructor', role='instructor')
+        course = Course.objects.create(title='Course', description='Course', instructor=instructor)
+        quiz = Quiz.objects.create(course=course, title='Quiz', description='Quiz', max_marks=1)
+        self.question = Question.objects.create(
+            quiz=quiz, question_text='Question', option_a='A', option_b='B', option_c='C', option_d='D',
+            correct_answer='A', marks=1
+        )
+        student = User.objects.create(username='student', role='student')
+        Enrollment.objects.create(student=student, course=course)
+        self.attempt, _ = start_attempt(quiz, student)
+        self.client.force_login(student)
+
+    def _autosave(self, answer):
+        return self.client.post(
+            reverse('quiz_autosave', args=[self.attempt.pk]),
+            {'answers': {str(self.question.pk): answer}},
+            content_type='application/json'
+        )
+
+    def test_null_clears_saved_answer(self):
+        self.assertEqual(self._autosave('A').json(), {'saved': 1})
+        self.assertEqual(self._autosave(None).json(), {'saved': 1})
+        self.assertFalse(QuizAnswer.objects.filter(attempt=self.attempt).exists())
+
+        self.assertTrue(submit_attempt(self.attempt, {}))
+        self.attempt.refresh_from_db()
+        self.assertEqual(self.attempt.score, 0)
+
+    def test_non_string_answer_is_rejected(self):
+        self.assertEqual(self._autosave(['A']).status_code, 400)
+
+@skipUnlessDBFeature('has_select_for_update')
+@override_settings(CACHES=TEST_CACHES, LMS_PROGRESS_QUEUE_EAGER=False)
+class ConcurrentQuizTests(TransactionTestCase):
+    """Simultaneous starts and submissions of one student's quiz share one attempt and grade it once"""
+    THREADS = 8
+
+    def setUp(self):
+        cache.clear()
+        instructor = User.objects.create(username='instructor', role='instructor')
+        course = Course.objects.create(title='Course', description='Course', instructor=instructor)
+        self.quiz = Quiz.objects.create(course=course, title='Quiz', description='Quiz', max_marks=2)
+        self.questions = [
+            Question.objects.create(
+                quiz=self.quiz, question_text=f'Question {order}', option_a='A', option_b='B', option_c='C',
+                option_d='D', correct_answer='A', marks=1, order=order
+            )
+            for order in range(2)
+        ]
+        self.student = User.objects.create(username='student', role='student')
+        Enrollment.objects.create(student=self.student, course=course)
+
+    def _concurrently(self, method, url, data=None):
+        """Send the same request from THREADS clients at once; returns the responses"""
+        barrier = threading.Barrier(self.THREADS)
+        responses = [None] * self.THREADS
+
+        def send(index):
+            client = Client()
+            client.force_login(self.student)
+            try:
+                barrier.wait()
+                responses[index] = getattr(client, method)(url, data)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=send, args=(index,)) for index in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return responses
+
+    def test_concurrent_take_and_submit(self):
+        responses = self._concurrently('get', reverse('quiz_take', args=[self.quiz.pk]))
+        self.assertTrue(all(response.status_code == 302 for response in responses))
+        attempts = QuizAttempt.objects.filter(quiz=self.quiz, student=self.student)
+        self.assertEqual(attempts.count(), 1)
+        self.assertEqual(attempts.filter(is_completed=False).count(), 1)
+        attempt = attempts.get()
+
+        gradings = []
+        def count_grading(sender, instance, **kwargs):
+            if instance.is_completed and kwargs.get('update_fields') and 'is_completed' in kwargs['update_fields']:
+                gradings.append(instance.pk)
+        post_save.connect(count_grading, sender=QuizAttempt, weak=False)
+        try:
+            answers = {f'question_{question.pk}': 'A' for question in self.questions}
+            responses = self._concurrently('post', reverse('quiz_attempt', args=[attempt.pk]), answers)
+        finally:
+            post_save.disconnect(count_grading, sender=QuizAttempt)
+
+        self.assertTrue(all(response.status_code == 302 for response in responses))
+        self.assertEqual(gradings, [attempt.pk])
+        attempt.refresh_from_db()
+        self.assertTrue(attempt.is_completed)
+        self.assertEqual(attempt.score, 2)
+        self.assertEqual(QuizAnswer.objects.filter(attempt=attempt).count(), 2)
+        best = QuizBestAttempt.objects.get(quiz=self.quiz, student=self.student)
+        self.assertEqual((best.attempt_id, best.attempt_count), (attempt.pk, 1))
+        self.assertEqual(Enrollment.objects.get(student=self.student).completed_items, 1)
@@ -11,7 +11,7 @@ from .views_assignments import (
 from .views_quizzes import (
     quiz_create, quiz_detail, quiz_edit, quiz_delete,
     question_create, question_edit, question_delete,
-    quiz_take, quiz_attempt, quiz_result
+    quiz_take, quiz_attempt, quiz_autosave, quiz_result
 )
 
 urlpatterns = [
@@ -71,6 +71,7 @@ urlpatterns = [
     
     # Quiz Attempts
     path('attempts/<int:attempt_id>/', quiz_attempt, name='quiz_attempt'),
+    path('attempts/<int:attempt_id>/autosave/', quiz_autosave, name='quiz_autosave'),
     path('attempts/<int:attempt_id>/result/', quiz_result, name='quiz_result'),
     
     # Badges
@@ -6,8 +6,8 @@ from django.utils import timezone
 from django.http import JsonResponse, HttpResponseForbidden
 from django.db.models import Q, Count, Avg
 from .models import (
-    User, Course, Enrollment, Module, Lesson, Assignment,
-    AssignmentSubmission, Quiz, Question, QuizAttempt, QuizAnswer,
+    User, Course, Enrollment, Lesson,
+    AssignmentSubmission, Question, QuizAttempt, QuizAnswer, QuizBestAttempt,
     Badge, StudentBadge, Discussion, DiscussionReply,
     StudentProfile, InstructorProfile, LessonProgress, ModuleProgress
 )
@@ -16,6 +16,12 @@ from .forms import (
     AssignmentForm, AssignmentSubmissionForm, GradeAssignmentForm,
     QuizForm, QuestionForm, AwardBadgeForm
 )
+from .access import can_access_course
+from .catalog import catalog_page, catalog_version, course_page
+from .conditional import ContentValidators
+from .dashboards import DASHBOARD_TIMEOUT, StudentDashboard, instructor_dashboard_courses, student_dashboard_version
+from .outline import course_outline, outline_version
+from .progress import student_module_progress
 
 # Home and Authentication Views
 def home(request):
@@ -92,14 +98,9 @@ def user_logout(request):
 # Dashboard Views
 @login_required
 def dashboard(request):
-    # Debug: Print user role
-    print(f"DEBUG: User {request.user.username} has role: {request.user.role}")
-    
     if request.user.role == 'instructor':
-        print(f"DEBUG: Redirecting to instructor dashboard")
         return instructor_dashboard(request)
     else:
-        print(f"DEBUG: Redirecting to student dashboard")
         return student_dashboard(request)
 
 @login_required
@@ -109,16 +110,13 @@ def instructor_dashboard(request):
         messages.error(request, 'Access denied. This page is for instructors only.')
         return redirect('home')
     
-    courses = Course.objects.filter(instructor=request.user)
-    total_students = Enrollment.objects.filter(course__instructor=request.user).count()
-    total_assignments = Assignment.objects.filter(course__instructor=request.user).count()
-    total_quizzes = Quiz.objects.filter(course__instructor=request.user).count()
+    courses = instructor_dashboard_courses(request.user)
     
     context = {
         'courses': courses,
-        'total_students': total_students,
-        'total_assignments': total_assignments,
-        'total_quizzes': total_quizzes,
+        'total_students': sum(course.student_count for course in courses),
+        'total_assignments': sum(course.assignment_count for course in courses),
+        'total_quizzes': sum(course.quiz_count for course in courses),
     }
     return render(request, 'lms/instructor_dashboard.html', context)
 
@@ -129,86 +127,89 @@ def student_dashboard(request):
         messages.error(request, 'Access denied. This page is for students only.')
         return redirect('home')
     
-    # Get enrolled courses
-    enrollments = Enrollment.objects.filter(student=request.user).select_related('course')
-    
-    # Get available courses (published and not enrolled)
-    enrolled_course_ids = enrollments.values_list('course_id', flat=True)
-    available_courses = Course.objects.filter(is_published=True).exclude(id__in=enrolled_course_ids)[:6]
-    
-    # Get assignments from enrolled courses
-    recent_assignments = Assignment.objects.filter(
-        course__enrollments__student=request.user
-    ).order_by('-due_date')[:5]
-    
-    # Get quizzes from enrolled courses
-    recent_quizzes = Quiz.objects.filter(
-        course__enrollments__student=request.user
-    ).order_by('-created_at')[:5]
-    
-    # Get earned badges
-    earned_badges = StudentBadge.objects.filter(student=request.user).select_related('badge')
-    
-    # Stats
-    total_enrollments = enrollments.count()
-    total_assignments = Assignment.objects.filter(course__enrollments__student=request.user).count()
-    total_quizzes = Quiz.objects.filter(course__enrollments__student=request.user).count()
-    
+    # Data is loaded lazily and only when the cached fragment is stale
     context = {
-        'enrollments': enrollments,
-        'available_courses': available_courses,
-        'recent_assignments': recent_assignments,
-        'recent_quizzes': recent_quizzes,
-        'earned_badges': earned_badges,
-        'total_enrollments': total_enrollments,
-        'total_assignments': total_assignments,
-        'total_quizzes': total_quizzes,
+        'dashboard': StudentDashboard(request.user),
+        'dashboard_version': student_dashboard_version(request.user.pk),
+        'catalog_version': catalog_version(),
+        'dashboard_timeout': DASHBOARD_TIMEOUT,
     }
     return render(request, 'lms/student_dashboard.html', context)
 
 # Course Views
 @login_required
 def course_list(request):
+    before = request.GET.get('before')
+    before = int(before) if before and before.isdigit() else None
+    
     if request.user.role == 'instructor':
-        courses = Course.objects.filter(instructor=request.user)
+        courses, next_before = course_page(Course.objects.filter(instructor=request.user), before)
         enrolled_course_ids = []
     else:
-        courses = Course.objects.filter(is_published=True)
-        # Get list of enrolled course IDs for this student
-        enrolled_course_ids = list(Enrollment.objects.filter(
-            student=request.user
+        # Catalog pages are cached and shared by all students; only enrollments are per user
+        courses, next_before = catalog_page(before)
+        enrolled_course_ids = set(Enrollment.objects.filter(
+            student=request.user,
+            course__in=[course.id for course in courses]
         ).values_list('course_id', flat=True))
     
     return render(request, 'lms/course_list.html', {
         'courses': courses,
-        'enrolled_course_ids': enrolled_course_ids
+        'enrolled_course_ids': enrolled_course_ids,
+        'next_before': next_before,
+        'is_first_page': before is None
     })
 
 @login_required
 def course_detail(request, course_id):
-    course = get_object_or_404(Course, id=course_id)
+    validators = None
+    if request.user.role == 'student':
+        # The page combines the shared outline with the student's own state
+        validators = ContentValidators(
+            request.user, outline_version(course_id), student_dashboard_version(request.user.pk)
+        )
+        not_modified = validators.not_modified(request)
+        if not_modified:
+            return not_modified
+    
+    course = get_object_or_404(Course.objects.select_related('instructor'), id=course_id)
     
     if request.user.role == 'student':
-        enrolled = Enrollment.objects.filter(student=request.user, course=course).exists()
         context = {
             'course': course,
-            'enrolled': enrolled,
-            'modules': course.modules.all(),
-            'assignments': course.assignments.all(),
-            'quizzes': course.quizzes.all(),
+            'enrolled': can_access_course(request.user, course.id),
         }
+        if context['enrolled']:
+            # Overlay the student's own state on the shared outline
+            context['completed_lesson_ids'] = set(LessonProgress.objects.filter(
+                student=request.user,
+                lesson__module__course=course,
+                is_completed=True
+            ).values_list('lesson_id', flat=True))
+            context['submitted_assignment_ids'] = set(AssignmentSubmission.objects.filter(
+                student=request.user,
+                assignment__course=course
+            ).values_list('assignment_id', flat=True))
+            context['completed_quiz_ids'] = set(QuizBestAttempt.objects.filter(
+                student=request.user,
+                quiz__course=course
+            ).values_list('quiz_id', flat=True))
     else:
         if course.instructor != request.user:
             return HttpResponseForbidden()
         context = {
             'course': course,
-            'modules': course.modules.all(),
-            'assignments': course.assignments.all(),
-            'quizzes': course.quizzes.all(),
-            'enrollments': course.enrollments.all(),
+            'enrollments': course.enrollments.select_related('student'),
         }
     
-    return render(request, 'lms/course_detail.html', context)
+    outline = course_outline(course.id)
+    context.update({
+        'modules': outline['modules'],
+        'assignments': outline['assignments'],
+        'quizzes': outline['quizzes'],
+    })
+    response = render(request, 'lms/course_detail.html', context)
+    return validators.apply(response) if validators else response
 
 @login_required
 def course_create(request):
@@ -363,8 +364,9 @@ def student_profile(request, user_id=None):
     
     # Get or create profile
     profile, created = StudentProfile.objects.get_or_create(user=student)
-    # Always update stats to show current data
-    profile.update_stats()
+    # Counters are maintained incrementally; only a freshly created profile needs a recount
+    if created:
+        profile.update_stats()
     
     # Get enrolled courses
     enrollments = Enrollment.objects.filter(student=student).select_related('course')
@@ -408,8 +410,9 @@ def instructor_profile(request, user_id=None):
     
     # Get or create profile
     profile, created = InstructorProfile.objects.get_or_create(user=instructor)
-    # Always update stats to show current data
-    profile.update_stats()
+    # Counters are maintained incrementally; only a freshly created profile needs a recount
+    if created:
+        profile.update_stats()
     
     # Get created courses
     courses = Course.objects.filter(instructor=instructor)
@@ -490,18 +493,19 @@ def mark_lesson_complete(request, lesson_id):
     if request.user.role != 'student':
         return HttpResponseForbidden()
     
-    lesson = get_object_or_404(Lesson, id=lesson_id)
+    lesson = get_object_or_404(Lesson.objects.select_related('module'), id=lesson_id)
     
     # Check if student is enrolled in the course
-    if not Enrollment.objects.filter(student=request.user, course=lesson.module.course).exists():
+    if not Enrollment.objects.filter(student=request.user, course_id=lesson.module.course_id).exists():
         messages.error(request, 'You must be enrolled in this course.')
-        return redirect('course_detail', course_id=lesson.module.course.id)
+        return redirect('course_detail', course_id=lesson.module.course_id)
     
     # Get or create lesson progress
     progress, created = LessonProgress.objects.get_or_create(
         student=request.user,
         lesson=lesson
     )
+    progress.lesson = lesson
     
     # Mark as complete
     progress.mark_complete()
@@ -525,32 +529,21 @@ def student_progress_dashboard(request):
     # Get all enrollments with progress
     enrollments = Enrollment.objects.filter(student=request.user).select_related('course')
     
-    # Get module progress for each enrollment
-    progress_data = []
-    for enrollment in enrollments:
-        modules = Module.objects.filter(course=enrollment.course)
-        module_progress = []
-        
-        for module in modules:
-            progress, created = ModuleProgress.objects.get_or_create(
-                student=request.user,
-                module=module
-            )
-            if created:
-                progress.update_completion()
-            
-            module_progress.append({
-                'module': module,
-                'progress': progress
-            })
-        
-        progress_data.append({
+    # Get module progress for every enrollment in one batched pass
+    module_progress = student_module_progress(request.user.id, [enrollment.course_id for enrollment in enrollments])
+    progress_data = [
+        {
             'enrollment': enrollment,
-            'module_progress': module_progress
-        })
+            'module_progress': [
+                {'module': module, 'progress': progress}
+                for module, progress in module_progress[enrollment.course_id]
+            ]
+        }
+        for enrollment in enrollments
+    ]
     
     # Get recent badges
-    recent_badges = StudentBadge.objects.filter(student=request.user).order_by('-awarded_at')[:5]
+    recent_badges = StudentBadge.objects.filter(student=request.user).select_related('badge').order_by('-awarded_at')[:5]
     
     context = {
         'profile': profile,
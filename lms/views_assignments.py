@@ -45,7 +45,7 @@ def assignment_detail(request, assignment_id):
         if course.instructor != request.user:
             return HttpResponseForbidden()
         
-        submissions = AssignmentSubmission.objects.filter(assignment=assignment)
+        submissions = AssignmentSubmission.objects.filter(assignment=assignment).select_related('student')
         context['submissions'] = submissions
     
     return render(request, 'lms/assignment_detail.html', context)
@@ -1,9 +1,12 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import HttpResponseForbidden
+from django.http import Http404, HttpResponseForbidden
 from .models import Course, Module, Lesson
 from .forms import ModuleForm, LessonForm
+from .access import can_access_course
+from .conditional import ContentValidators
+from .outline import outline_version
 
 # Module Views
 @login_required
@@ -76,19 +79,25 @@ def lesson_create(request, module_id):
 
 @login_required
 def lesson_detail(request, lesson_id):
-    lesson = get_object_or_404(Lesson, id=lesson_id)
-    course = lesson.module.course
+    course_id = Lesson.objects.filter(id=lesson_id).values_list('module__course_id', flat=True).first()
+    if course_id is None:
+        raise Http404('No Lesson matches the given query.')
     
     # Check access
-    if request.user.role == 'student':
-        from .models import Enrollment
-        if not Enrollment.objects.filter(student=request.user, course=course).exists():
-            return HttpResponseForbidden()
-    elif request.user.role == 'instructor':
-        if course.instructor != request.user:
-            return HttpResponseForbidden()
+    if not can_access_course(request.user, course_id):
+        return HttpResponseForbidden()
     
-    return render(request, 'lms/lesson_detail.html', {'lesson': lesson, 'course': course})
+    # Lesson, module and course edits all move the course outline version
+    validators = ContentValidators(request.user, outline_version(course_id))
+    not_modified = validators.not_modified(request)
+    if not_modified:
+        return not_modified
+    
+    # The page serves the stored rendition, not the raw source
+    lesson = get_object_or_404(Lesson.objects.select_related('module__course').defer('content'), id=lesson_id)
+    course = lesson.module.course
+    response = render(request, 'lms/lesson_detail.html', {'lesson': lesson, 'course': course})
+    return validators.apply(response)
 
 @login_required
 def lesson_edit(request, lesson_id):
@@ -1,10 +1,25 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import HttpResponseForbidden
+import json
+
+from django.http import HttpResponseForbidden, JsonResponse
+from django.views.decorators.http import require_POST
+from django.db.models import Avg, Count, Q
 from django.utils import timezone
-from .models import Course, Quiz, Question, QuizAttempt, QuizAnswer, Enrollment
+from .models import Course, Quiz, Question, QuizAttempt, QuizBestAttempt, Enrollment
 from .forms import QuizForm, QuestionForm
+from .access import can_access_course
+from .analytics import attempt_summary, item_analysis
+from .conditional import ContentValidators
+from .dashboards import student_dashboard_version
+from .grading import (
+    SUMMARY_FIELDS, accepts_answers, answer_key, autosave_answers, quiz_version, request_regrade, start_attempt,
+    submit_attempt, summarize_attempts
+)
+from .outline import outline_version
+
+ATTEMPTS_PER_PAGE = 50
 
 # Quiz Views
 @login_required
@@ -26,27 +41,66 @@ def quiz_create(request, course_id):
 
 @login_required
 def quiz_detail(request, quiz_id):
-    quiz = get_object_or_404(Quiz, id=quiz_id)
+    validators = None
+    if request.user.role == 'student':
+        course_id = Quiz.objects.filter(id=quiz_id).values_list('course_id', flat=True).first()
+        if course_id is not None:
+            if not can_access_course(request.user, course_id):
+                return HttpResponseForbidden()
+            # Quiz and course details, its questions and the student's attempts
+            validators = ContentValidators(
+                request.user, outline_version(course_id), quiz_version(quiz_id),
+                student_dashboard_version(request.user.pk)
+            )
+            not_modified = validators.not_modified(request)
+            if not_modified:
+                return not_modified
+    
+    quiz = get_object_or_404(Quiz.objects.select_related('course'), id=quiz_id)
     course = quiz.course
     
     context = {'quiz': quiz, 'course': course}
     
     if request.user.role == 'student':
-        if not Enrollment.objects.filter(student=request.user, course=course).exists():
-            return HttpResponseForbidden()
-        
-        attempts = QuizAttempt.objects.filter(quiz=quiz, student=request.user).order_by('-started_at')
+        attempts = list(QuizAttempt.objects.filter(quiz=quiz, student=request.user).order_by('-started_at'))
+        best = QuizBestAttempt.objects.filter(quiz=quiz, student=request.user).first()
+        used = best.attempt_count if best else 0
         context['attempts'] = attempts
+        context['best'] = best
+        context['attempts_left'] = max(quiz.max_attempts - used, 0)
+        context['can_start'] = not any(not attempt.is_completed for attempt in attempts) and used < quiz.max_attempts
         context['questions'] = quiz.questions.all()
     
     elif request.user.role == 'instructor':
         if course.instructor != request.user:
             return HttpResponseForbidden()
         
-        context['questions'] = quiz.questions.all()
-        context['attempts'] = QuizAttempt.objects.filter(quiz=quiz)
+        analysis = item_analysis(quiz.id)
+        questions = list(quiz.questions.all())
+        for question in questions:
+            question.stats = analysis['questions'].get(question.id)
+        context['questions'] = questions
+        context['analysed_attempts'] = analysis['attempts']
+        context['summary'] = attempt_summary(quiz)
+        # Gradebook over each student's best attempt
+        context['gradebook'] = QuizBestAttempt.objects.filter(quiz=quiz).aggregate(
+            students=Count('pk'),
+            mean_best=Avg('score'),
+            passed=Count('pk', filter=Q(passed=True))
+        )
+        
+        # Keyset pagination, newest attempts first
+        attempts = QuizAttempt.objects.filter(quiz=quiz).select_related('student').order_by('-id')
+        before = request.GET.get('before')
+        if before and before.isdigit():
+            attempts = attempts.filter(id__lt=int(before))
+        page = list(attempts[:ATTEMPTS_PER_PAGE + 1])
+        context['attempts'] = page[:ATTEMPTS_PER_PAGE]
+        context['next_before'] = page[ATTEMPTS_PER_PAGE - 1].id if len(page) > ATTEMPTS_PER_PAGE else None
+        context['is_first_page'] = not before
     
-    return render(request, 'lms/quiz_detail.html', context)
+    response = render(request, 'lms/quiz_detail.html', context)
+    return validators.apply(response) if validators else response
 
 @login_required
 def quiz_edit(request, quiz_id):
@@ -59,6 +113,9 @@ def quiz_edit(request, quiz_id):
         if form.is_valid():
             form.save()
             messages.success(request, 'Quiz updated successfully!')
+            # Stored result summaries depend on the quiz's marks
+            if {'max_marks', 'pass_marks'} & set(form.changed_data):
+                request_regrade(quiz.id)
             return redirect('quiz_detail', quiz_id=quiz.id)
     else:
         form = QuizForm(instance=quiz)
@@ -110,6 +167,8 @@ def question_edit(request, question_id):
         if form.is_valid():
             form.save()
             messages.success(request, 'Question updated successfully!')
+            if {'correct_answer', 'marks'} & set(form.changed_data):
+                messages.info(request, 'Existing attempts will be regraded.')
             return redirect('quiz_detail', quiz_id=question.quiz.id)
     else:
         form = QuestionForm(instance=question)
@@ -138,97 +197,112 @@ def quiz_take(request, quiz_id):
     if request.user.role != 'student':
         return HttpResponseForbidden()
     
-    if not Enrollment.objects.filter(student=request.user, course=quiz.course).exists():
+    # Resume or start an attempt atomically, so double clicks and retries share one
+    try:
+        attempt, created = start_attempt(quiz, request.user)
+    except Enrollment.DoesNotExist:
         return HttpResponseForbidden()
     
-    # Check if student has already attempted this quiz
-    existing_attempt = QuizAttempt.objects.filter(
-        quiz=quiz,
-        student=request.user,
-        is_completed=True
-    ).first()
-    
-    if existing_attempt:
-        messages.warning(request, 'You have already completed this quiz. You can only attempt each quiz once.')
-        return redirect('quiz_result', attempt_id=existing_attempt.id)
-    
-    # Check for incomplete attempt
-    incomplete_attempt = QuizAttempt.objects.filter(
-        quiz=quiz,
-        student=request.user,
-        is_completed=False
-    ).first()
-    
-    if incomplete_attempt:
-        # Continue existing attempt
-        return redirect('quiz_attempt', attempt_id=incomplete_attempt.id)
-    
-    # Create new attempt
-    attempt = QuizAttempt.objects.create(
-        quiz=quiz,
-        student=request.user
-    )
+    if attempt.is_completed:
+        if quiz.max_attempts == 1:
+            messages.warning(request, 'You have already completed this quiz. You can only attempt each quiz once.')
+        else:
+            messages.warning(request, f'You have used all {quiz.max_attempts} attempts at this quiz. Showing your best attempt.')
+        return redirect('quiz_result', attempt_id=attempt.id)
     
     return redirect('quiz_attempt', attempt_id=attempt.id)
 
 @login_required
 def quiz_attempt(request, attempt_id):
-    attempt = get_object_or_404(QuizAttempt, id=attempt_id, student=request.user)
+    attempt = get_object_or_404(QuizAttempt.objects.select_related('quiz'), id=attempt_id, student=request.user)
     
     if attempt.is_completed:
         return redirect('quiz_result', attempt_id=attempt.id)
     
-    questions = attempt.quiz.questions.all()
+    if not accepts_answers(attempt):
+        # Time ran out: grade what was autosaved before the deadline
+        if submit_attempt(attempt, {}):
+            messages.info(request, 'Time is up. Your quiz was graded on the answers saved before the deadline.')
+        return redirect('quiz_result', attempt_id=attempt.id)
     
     if request.method == 'POST':
-        # Save answers
-        score = 0
-        total_marks = 0
-        
-        for question in questions:
-            selected_answer = request.POST.get(f'question_{question.id}')
-            if selected_answer:
-                is_correct = selected_answer == question.correct_answer
-                QuizAnswer.objects.create(
-                    attempt=attempt,
-                    question=question,
-                    selected_answer=selected_answer,
-                    is_correct=is_correct
-                )
-                
-                if is_correct:
-                    score += question.marks
-                total_marks += question.marks
-        
-        # Update attempt
-        attempt.score = score
-        attempt.submitted_at = timezone.now()
-        attempt.is_completed = True
-        attempt.save()
-        
-        messages.success(request, 'Quiz submitted successfully!')
+        # Grade against the cached answer key and save all answers at once
+        selections = {
+            question_id: request.POST.get(f'question_{question_id}')
+            for question_id in answer_key(attempt.quiz_id)
+        }
+        if submit_attempt(attempt, selections):
+            messages.success(request, 'Quiz submitted successfully!')
         return redirect('quiz_result', attempt_id=attempt.id)
     
+    # Restore autosaved answers, e.g. after a dropped connection or reload
+    saved = dict(attempt.answers.values_list('question_id', 'selected_answer'))
+    questions = list(attempt.quiz.questions.all())
+    for question in questions:
+        question.saved_answer = saved.get(question.id)
+    
+    if attempt.deadline_at is None:
+        remaining_seconds = attempt.quiz.duration_minutes * 60
+    else:
+        remaining_seconds = max(int((attempt.deadline_at - timezone.now()).total_seconds()), 0)
+    
     return render(request, 'lms/quiz_attempt.html', {
         'attempt': attempt,
         'quiz': attempt.quiz,
-        'questions': questions
+        'questions': questions,
+        'remaining_seconds': remaining_seconds
     })
 
+@login_required
+@require_POST
+def quiz_autosave(request, attempt_id):
+    """Upsert answers picked so far; expects JSON {"answers": {"<question_id>": "A"}}, null clearing an answer"""
+    attempt = get_object_or_404(
+        QuizAttempt.objects.only('id', 'quiz_id', 'is_completed', 'deadline_at'),
+        id=attempt_id,
+        student=request.user
+    )
+    
+    if attempt.is_completed:
+        return JsonResponse({'error': 'This attempt has already been submitted.'}, status=409)
+    if not accepts_answers(attempt):
+        return JsonResponse({'error': 'The time limit for this attempt has passed.'}, status=409)
+    
+    try:
+        answers = json.loads(request.body)['answers']
+        selections = {}
+        for question_id, answer in answers.items():
+            # An option label, or null for a cleared answer
+            if answer is not None and not isinstance(answer, str):
+                raise ValueError(answer)
+            selections[int(question_id)] = answer
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return JsonResponse({'error': 'Invalid answers payload.'}, status=400)
+    
+    return JsonResponse({'saved': autosave_answers(attempt, selections)})
+
 @login_required
 def quiz_result(request, attempt_id):
-    attempt = get_object_or_404(QuizAttempt, id=attempt_id)
+    attempt = get_object_or_404(QuizAttempt.objects.select_related('quiz', 'quiz__course', 'student'), id=attempt_id)
     
     # Check access
-    if request.user.role == 'student' and attempt.student != request.user:
+    if request.user.role == 'student' and attempt.student_id != request.user.id:
         return HttpResponseForbidden()
-    elif request.user.role == 'instructor' and attempt.quiz.course.instructor != request.user:
+    elif request.user.role == 'instructor' and attempt.quiz.course.instructor_id != request.user.id:
         return HttpResponseForbidden()
     
-    answers = attempt.answers.all().select_related('question')
+    # Attempts graded before summaries were stored get theirs on first view
+    if attempt.is_completed and attempt.correct_count is None:
+        summarize_attempts(QuizAttempt.objects.filter(pk=attempt.pk))
+        attempt.refresh_from_db(fields=SUMMARY_FIELDS)
+    
+    # The summary renders from the attempt row; the full answer review is loaded on request
+    review = request.GET.get('review') == '1'
+    answers = attempt.answers.all().select_related('question').order_by('question__order', 'question_id') if review else None
     
     return render(request, 'lms/quiz_result.html', {
         'attempt': attempt,
         'quiz': attempt.quiz,
-        'answers': answers
+        'answers': answers,
+        'review': review
     })
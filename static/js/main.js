@@ -58,7 +58,7 @@ function validateForm(formId) {
 
 // Quiz timer
 function startQuizTimer(durationMinutes, displayElement) {
-    let totalSeconds = durationMinutes * 60;
+    let totalSeconds = Math.max(Math.floor(durationMinutes * 60), 0);
     
     const timer = setInterval(function() {
         const minutes = Math.floor(totalSeconds / 60);
@@ -76,6 +76,48 @@ function startQuizTimer(durationMinutes, displayElement) {
     }, 1000);
 }
 
+// Quiz answer autosave: changes are coalesced and sent in one request every few seconds
+function startQuizAutosave(form, intervalMs) {
+    if (!form || !form.dataset.autosaveUrl) {
+        return;
+    }
+    const csrfToken = form.querySelector('[name=csrfmiddlewaretoken]').value;
+    let pending = {};
+    let saving = false;
+    
+    form.addEventListener('change', function(e) {
+        if (e.target.type === 'radio' && e.target.name.startsWith('question_')) {
+            // Only the latest choice per question is sent
+            pending[e.target.name.replace('question_', '')] = e.target.value;
+        }
+    });
+    
+    function flush() {
+        if (saving || Object.keys(pending).length === 0) {
+            return;
+        }
+        const answers = pending;
+        pending = {};
+        saving = true;
+        fetch(form.dataset.autosaveUrl, {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json', 'X-CSRFToken': csrfToken},
+            body: JSON.stringify({answers: answers})
+        }).then(function(response) {
+            if (!response.ok && response.status !== 409) {
+                throw new Error('Autosave failed');
+            }
+        }).catch(function() {
+            // Keep failed answers for the next flush unless they were changed again meanwhile
+            pending = Object.assign(answers, pending);
+        }).finally(function() {
+            saving = false;
+        });
+    }
+    
+    setInterval(flush, intervalMs || 3000);
+}
+
 // Confirm delete actions
 function confirmDelete(message) {
     return confirm(message || 'Are you sure you want to delete this item?');